@@ -1,15 +1,22 @@
 import os
+import hmac
+import time
+import signal
 import requests
 from dotenv import load_dotenv
-from flask import Flask, request, abort, send_from_directory
+from flask import Flask, request, abort, send_from_directory, jsonify, Response
 from linebot.exceptions import InvalidSignatureError
 from pyngrok import ngrok
 from backend.utils.member_utils import get_base_static_url
+from backend.utils.metrics import metrics
+from backend.utils.json_codec import InvalidBodyError
+from backend.utils.profiler import profiler, slow_events
 
 load_dotenv()
 
 CHANNEL_SECRET = os.getenv("LINE_CHANNEL_SECRET")
 CHANNEL_TOKEN = os.getenv("LINE_CHANNEL_ACCESS_TOKEN")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")  # 未設定時停用所有 /admin 端點
 
 if not CHANNEL_SECRET or not CHANNEL_TOKEN:
     raise ValueError("❌ 缺少 LINE_CHANNEL_SECRET 或 LINE_CHANNEL_ACCESS_TOKEN，請確認 .env 設定")
@@ -19,19 +26,123 @@ from backend.handlers import webhook_handler
 app = Flask(__name__)
 
 @app.route("/callback", methods=["POST"])
-def callback():
+@app.route("/callback/<channel>", methods=["POST"])
+def callback(channel=None):
     signature = request.headers.get("X-Line-Signature")
-    body = request.get_data(as_text=True)
+    body = request.get_data()  # 保留原始位元組，驗章與解析都直接使用
+    # 處理中的 webhook 數，排程器據此延後低優先的背景工作
+    metrics.adjust("webhook.inflight", 1)
     try:
-        webhook_handler.handle_body(body, signature)
-    except InvalidSignatureError:
+        webhook_handler.handle_body(body, signature, channel)
+    except (InvalidSignatureError, InvalidBodyError):
         abort(400)
     except Exception as e:
         print("Webhook 處理失敗：", e)
         abort(500)
+    finally:
+        metrics.adjust("webhook.inflight", -1)
     return "OK"
 
 
+def require_admin():
+    token = request.headers.get("X-Admin-Token") or ""
+    # 固定時間比較，避免從回應時間逐字猜出 token
+    if not ADMIN_TOKEN or not hmac.compare_digest(token.encode("utf-8"), ADMIN_TOKEN.encode("utf-8")):
+        abort(403)
+
+
+@app.route("/admin/broadcast", methods=["POST"])
+def admin_broadcast():
+    require_admin()
+    from linebot.models import TextSendMessage
+    data = request.get_json(silent=True) or {}
+    manager = webhook_handler.broadcast_manager
+
+    job_id = data.get("job_id")  # 帶入 job_id 表示從檢查點續傳
+    if not job_id:
+        if not data.get("text"):
+            abort(400)
+        recipients = manager.select_recipients(level=data.get("level"), currency=data.get("currency"))
+        if not recipients:
+            return jsonify({"job_id": None, "recipients": 0})
+        job_id = manager.create_job([TextSendMessage(text=data["text"])], recipients)
+
+    started = manager.start(job_id)
+    if started is None:
+        abort(404)  # 格式不符或檢查點檔不存在
+    if not started:
+        abort(409)  # 同一工作已在執行中，重複續傳會送出相同批次
+    return jsonify({"job_id": job_id})
+
+
+@app.route("/admin/broadcast/<job_id>")
+def admin_broadcast_status(job_id):
+    require_admin()
+    report = webhook_handler.broadcast_manager.reports.get(job_id)
+    if report is None:
+        abort(404)
+    return jsonify(report)
+
+
+@app.route("/admin/metrics")
+def admin_metrics():
+    require_admin()
+    return jsonify(metrics.snapshot())
+
+
+@app.route("/admin/quiz-stats")
+def admin_quiz_stats():
+    require_admin()
+    level = request.args.get("level")
+    limit = request.args.get("limit", type=int)
+    return jsonify(webhook_handler.quiz_manager.analytics.query(level=level, limit=limit))
+
+
+@app.route("/admin/profiler/start", methods=["POST"])
+def admin_profiler_start():
+    require_admin()
+    interval_ms = request.args.get("interval_ms", type=float)
+    started = profiler.start(interval_ms / 1000 if interval_ms else None)
+    return jsonify({"running": True, "started": started})
+
+
+@app.route("/admin/profiler/stop", methods=["POST"])
+def admin_profiler_stop():
+    require_admin()
+    stopped = profiler.stop()
+    return jsonify({"running": False, "stopped": stopped, "samples": profiler.samples})
+
+
+@app.route("/admin/profiler/flamegraph")
+def admin_profiler_flamegraph():
+    require_admin()
+    return Response(profiler.collapsed(), mimetype="text/plain")
+
+
+@app.route("/admin/slow-events")
+def admin_slow_events():
+    require_admin()
+    return jsonify(slow_events.snapshot())
+
+
+@app.route("/admin/scheduler")
+def admin_scheduler():
+    require_admin()
+    return jsonify(webhook_handler.scheduler.snapshot())
+
+
+def toggle_profiler(signum, frame):
+    """kill -USR2 <pid> 切換取樣；停止時把結果寫到 profile-<時間>.folded"""
+    if not profiler.running:
+        profiler.start()
+        return
+    profiler.stop()
+    path = f"profile-{time.strftime('%Y%m%d%H%M%S')}.folded"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(profiler.collapsed())
+    print("取樣結果已寫入", path)
+
+
 @app.route("/static/<path:filename>")
 def static_files(filename):
     static_dir = os.path.join(os.path.dirname(__file__), "static")
@@ -66,6 +177,9 @@ if __name__ == "__main__":
         base_url = get_base_static_url()
         print("使用預設 BASE_STATIC_URL：", base_static_url)
 
+    if hasattr(signal, "SIGUSR2"):
+        signal.signal(signal.SIGUSR2, toggle_profiler)
+
     webhook_handler.init_line_bot(CHANNEL_SECRET, CHANNEL_TOKEN)
 
     app.run(port=port)
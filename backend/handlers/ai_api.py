@@ -1,4 +1,5 @@
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -7,13 +8,37 @@ from linebot.models import TextSendMessage, FlexSendMessage
 
 import google.generativeai as genai
 
+from backend.utils.metrics import metrics
+from backend.utils.profiler import stage
+from backend.utils.conversation_memory import ConversationMemory, estimate_tokens
+
+AI_INSTRUCTION = '請與金融相關回覆，字數300字內'
+
 class AIManager:
-    def __init__(self):
+    def __init__(self, faq_index=None, faq_threshold=0.8, memory=None):
         gemini_api_key = os.getenv("GEMINI_API_KEY")
         if not gemini_api_key:
             raise ValueError("請設定 GEMINI_API_KEY")
         genai.configure(api_key=gemini_api_key)
         self.model = genai.GenerativeModel('models/gemini-2.5-pro')  # 確認你的模型名稱正確
+        self.faq_index = faq_index  # 本地檢索索引，可為 None
+        self.faq_threshold = faq_threshold  # 信心值達此門檻才直接回答
+        self.memory = memory or ConversationMemory()  # 每位用戶的多輪對話記憶
+
+    def lookup_faq(self, question):
+        """先查本地題庫，高信心命中時回傳答案，否則回傳 None 交給 Gemini"""
+        if not self.faq_index:
+            return None
+        start = time.perf_counter()
+        with stage("faq_lookup"):
+            result = self.faq_index.search(question)
+        metrics.observe("ai.faq_lookup", time.perf_counter() - start)
+        if result and result[2] >= self.faq_threshold:
+            metrics.incr("ai.faq_hit")
+            matched_question, answer, _ = result
+            return f"{matched_question}\n答：{answer}"
+        metrics.incr("ai.faq_miss")
+        return None
 
     def get_ai_mode_flex(self):
         # 回傳 Flex Message 告知用戶已進入 AI 客服模式
@@ -56,14 +81,24 @@ class AIManager:
         }
         return [FlexSendMessage(alt_text="AI客服模式", contents=flex_content)]
 
+    def end_session(self, user_id):
+        self.memory.end_session(user_id)
+
     def ask(self, user_id, question):
+        answer = self.lookup_faq(question)
+        if answer:
+            self.memory.add_turn(user_id, question, answer)
+            return [TextSendMessage(text=answer)]
         try:
-            # 兩條訊息都放入 list，讓AI回覆限制在金融相關，且字數控制300字內
-            response = self.model.generate_content([
-                question,
-                '請與金融相關回覆，字數300字內'
-            ])
+            # 帶入對話摘要與最近幾輪對話，最後附上限制金融相關、300字內的指示
+            prompt = self.memory.build_prompt(user_id, question, AI_INSTRUCTION)
+            # token 數不是耗時，記成累計值與次數，平均 = total / count
+            metrics.incr("ai.prompt_tokens.total", estimate_tokens("".join(prompt)))
+            metrics.incr("ai.prompt_tokens.count")
+            with stage("gemini"):
+                response = self.model.generate_content(prompt)
             if hasattr(response, "text") and response.text.strip():
+                self.memory.add_turn(user_id, question, response.text)
                 return [TextSendMessage(text=response.text)]
             else:
                 print(f"AI 回覆為空: {response}")
@@ -0,0 +1,242 @@
+import os
+import re
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+BROADCAST_JOB_DIR = os.path.join(os.path.dirname(__file__), "..", "members", "broadcast_jobs")
+MULTICAST_LIMIT = 500  # LINE multicast 每次最多 500 位收件者
+JOB_ID_RE = re.compile(r"\d{14}-[0-9a-f]{8}")  # 與 create_job 產生的格式相同，也避免被拼成任意路徑
+
+
+class RawMessage:
+    """已序列化的訊息，讓從檢查點續傳的工作可以直接交給 SDK 送出"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def as_json_dict(self):
+        return self.data
+
+
+class RateLimiter:
+    """Token bucket，多個送出執行緒共用同一個速率上限"""
+
+    def __init__(self, rate_per_sec, burst=None):
+        self.rate = float(rate_per_sec)
+        self.capacity = float(burst or rate_per_sec)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class BroadcastManager:
+    def __init__(self, member_store, send_func, job_dir=BROADCAST_JOB_DIR, max_workers=4, rate_per_sec=100):
+        self.member_store = member_store
+        self.send_func = send_func  # (user_ids, messages) -> None，通常是 line_bot_api.multicast
+        self.job_dir = job_dir
+        self.max_workers = max_workers
+        self.limiter = RateLimiter(rate_per_sec)
+        self.reports = {}  # job_id -> 最新進度報告
+        self.running = set()  # 執行中的 job_id，同一工作同時只能跑一份，否則會重複送出
+        self.running_lock = threading.Lock()
+
+    def select_recipients(self, level=None, currency=None):
+        """依會員等級或訂閱幣種挑選收件者，不指定條件則為全部會員"""
+        recipients = []
+        # webhook 執行緒可能同時新增會員，先取快照再逐筆過濾
+        for user_id, member in list(self.member_store.items()):
+            if level and member.get("member_level") != level:
+                continue
+            if currency and currency not in member.get("subscribed_currencies", []):
+                continue
+            recipients.append(user_id)
+        return recipients
+
+    def job_paths(self, job_id):
+        if not JOB_ID_RE.fullmatch(job_id or ""):
+            raise ValueError(f"無效的 job_id：{job_id!r}")
+        base = os.path.join(self.job_dir, job_id)
+        return base + ".json", base + ".progress"
+
+    def job_exists(self, job_id):
+        if not isinstance(job_id, str) or not JOB_ID_RE.fullmatch(job_id):
+            return False
+        return os.path.isfile(self.job_paths(job_id)[0])
+
+    def _claim(self, job_id):
+        with self.running_lock:
+            if job_id in self.running:
+                return False
+            self.running.add(job_id)
+            return True
+
+    def _release(self, job_id):
+        with self.running_lock:
+            self.running.discard(job_id)
+
+    def start(self, job_id):
+        """在背景執行緒執行工作；工作不存在回傳 None，已在執行中回傳 False"""
+        if not self.job_exists(job_id):
+            return None
+        if not self._claim(job_id):
+            return False
+        threading.Thread(target=self._run_claimed, args=(job_id,), daemon=True).start()
+        return True
+
+    def create_job(self, messages, recipients):
+        """把收件者切成 multicast 批次並寫入檢查點檔，回傳 job_id"""
+        os.makedirs(self.job_dir, exist_ok=True)
+        job_id = time.strftime("%Y%m%d%H%M%S") + "-" + uuid.uuid4().hex[:8]
+        job = {
+            "job_id": job_id,
+            "created": time.time(),
+            "messages": [m.as_json_dict() for m in messages],
+            "batches": [recipients[i:i + MULTICAST_LIMIT] for i in range(0, len(recipients), MULTICAST_LIMIT)],
+        }
+        job_path, _ = self.job_paths(job_id)
+        with open(job_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        print(f"[BroadcastManager] 建立推播工作 {job_id}：{len(recipients)} 人，{len(job['batches'])} 批")
+        return job_id
+
+    def load_progress(self, job_id):
+        _, progress_path = self.job_paths(job_id)
+        done = set()
+        if os.path.isfile(progress_path):
+            with open(progress_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        done.add(int(line))
+        return done
+
+    def run(self, job_id):
+        """送出尚未完成的批次；中斷後再次呼叫會從檢查點續傳"""
+        if not self._claim(job_id):
+            raise RuntimeError(f"推播工作 {job_id} 已在執行中")
+        return self._run_claimed(job_id)
+
+    def _run_claimed(self, job_id):
+        try:
+            return self._run(job_id)
+        except Exception as e:
+            print(f"[BroadcastManager] 工作 {job_id} 執行失敗：{e}")
+            raise
+        finally:
+            self._release(job_id)
+
+    def _run(self, job_id):
+        job_path, progress_path = self.job_paths(job_id)
+        with open(job_path, "r", encoding="utf-8") as f:
+            job = json.load(f)
+        messages = [RawMessage(m) for m in job["messages"]]
+        batches = job["batches"]
+        done = self.load_progress(job_id)
+        pending = [i for i in range(len(batches)) if i not in done]
+
+        report = {
+            "job_id": job_id,
+            "recipients": sum(len(b) for b in batches),
+            "batches": len(batches),
+            "skipped_batches": len(done),
+            "sent_batches": 0,
+            "failed_batches": 0,
+            "sent_recipients": 0,
+            "elapsed": 0.0,
+            "throughput": 0.0,
+            "finished": False,
+        }
+        self.reports[job_id] = report
+        lock = threading.Lock()
+        start = time.perf_counter()
+
+        # 進度檔只追加已完成的批次編號，續傳時不必重寫整個工作檔
+        with open(progress_path, "a", encoding="utf-8") as progress_file:
+            def send_batch(index):
+                self.limiter.acquire()
+                try:
+                    self.send_func(batches[index], messages)
+                except Exception as e:
+                    print(f"[BroadcastManager] 第 {index} 批送出失敗：{e}")
+                    with lock:
+                        report["failed_batches"] += 1
+                    return
+                with lock:
+                    progress_file.write(f"{index}\n")
+                    progress_file.flush()
+                    report["sent_batches"] += 1
+                    report["sent_recipients"] += len(batches[index])
+                    report["elapsed"] = time.perf_counter() - start
+                    report["throughput"] = report["sent_recipients"] / report["elapsed"] if report["elapsed"] else 0.0
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                list(executor.map(send_batch, pending))
+
+        report["elapsed"] = time.perf_counter() - start
+        report["throughput"] = report["sent_recipients"] / report["elapsed"] if report["elapsed"] else 0.0
+        report["finished"] = report["failed_batches"] == 0
+        print(
+            f"[BroadcastManager] 工作 {job_id} 完成：送出 {report['sent_batches']}/{len(pending)} 批，"
+            f"{report['sent_recipients']} 人，{report['throughput']:.0f} 人/秒"
+        )
+        return report
+
+    def broadcast(self, messages, level=None, currency=None):
+        recipients = self.select_recipients(level=level, currency=currency)
+        if not recipients:
+            print("[BroadcastManager] 沒有符合條件的收件者")
+            return None
+        job_id = self.create_job(messages, recipients)
+        return self.run(job_id)
+
+
+if __name__ == "__main__":
+    # 以本機假 LINE API 測量吞吐量：python -m backend.handlers.broadcast_api [會員數]
+    import sys
+    import tempfile
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from linebot import LineBotApi
+    from linebot.models import TextSendMessage
+
+    class StubLineApi(BaseHTTPRequestHandler):
+        received = 0
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.path == "/v2/bot/message/multicast":
+                StubLineApi.received += len(json.loads(body)["to"])
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *args):
+            pass
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubLineApi)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api = LineBotApi("stub-token", endpoint=f"http://127.0.0.1:{server.server_port}")
+
+    store = {f"U{i:032x}": {"member_level": "一般會員"} for i in range(count)}
+    with tempfile.TemporaryDirectory() as tmp:
+        manager = BroadcastManager(store, api.multicast, job_dir=tmp, max_workers=8, rate_per_sec=1000)
+        report = manager.broadcast([TextSendMessage(text="壓力測試")], level="一般會員")
+    server.shutdown()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"假 API 收到 {StubLineApi.received} 位收件者")
@@ -0,0 +1,92 @@
+import os
+import json
+
+from linebot import LineBotApi
+
+from backend.utils.json_codec import ReplyClient
+from .richmenu_api import RichMenuManager, RICH_MENU_STATE_PATH
+
+DEFAULT_CHANNEL = "default"
+# 額外頻道設定檔：[{"name", "channel_secret", "channel_access_token"}]，各頻道的 webhook 為 /callback/<name>
+CHANNELS_FILE = os.getenv("LINE_CHANNELS_FILE", os.path.join(os.path.dirname(__file__), "..", "..", "channels.json"))
+
+
+class Channel:
+    """單一 LINE 頻道的憑證與 API 用戶端；題庫、匯率、AI 快取等由所有頻道共用"""
+
+    def __init__(self, name, channel_secret, channel_access_token):
+        self.name = name
+        self.channel_secret = channel_secret
+        self.line_bot_api = LineBotApi(channel_access_token)
+        self.reply_client = ReplyClient(channel_access_token)
+        # 預設頻道不加前綴，沿用既有 members.json 與狀態資料
+        self.namespace = "" if name == DEFAULT_CHANNEL else name + ":"
+        if name == DEFAULT_CHANNEL:
+            state_path = RICH_MENU_STATE_PATH
+        else:
+            state_path = RICH_MENU_STATE_PATH.replace(".json", f".{name}.json")
+        self.rich_menus = RichMenuManager(state_path=state_path)
+
+    def state_key(self, user_id):
+        """各頻道的用戶狀態、會員資料都以此鍵值區隔"""
+        if not user_id:
+            raise ValueError(f"頻道 {self.name} 的事件缺少 user_id")
+        return self.namespace + user_id
+
+
+class ChannelRegistry:
+    def __init__(self):
+        self.channels = {}  # name -> Channel
+
+    def register(self, channel):
+        self.channels[channel.name] = channel
+        print(f"[ChannelRegistry] 註冊頻道 {channel.name}")
+        return channel
+
+    def load_file(self, path=CHANNELS_FILE):
+        if not os.path.isfile(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                items = json.load(f)
+        except Exception as e:
+            print(f"[ChannelRegistry] 載入頻道設定失敗：{e}")
+            return
+        for item in items:
+            self.register(Channel(item["name"], item["channel_secret"], item["channel_access_token"]))
+
+    def get(self, name):
+        return self.channels.get(name)
+
+    def find(self, name=None):
+        """/callback/<name> 對應該頻道，/callback 為預設頻道；只看路由，不需先解析內容"""
+        return self.channels.get(name or DEFAULT_CHANNEL)
+
+    def resolve_key(self, key):
+        """狀態鍵值 -> (Channel, LINE user_id)；LINE 的 user_id 不含冒號，可安全切開"""
+        if ":" in key:
+            name, user_id = key.split(":", 1)
+            channel = self.channels.get(name)
+            if channel:
+                return channel, user_id
+        return self.channels.get(DEFAULT_CHANNEL), key
+
+    def push(self, key, messages):
+        channel, user_id = self.resolve_key(key)
+        channel.line_bot_api.push_message(user_id, messages)
+
+    def multicast(self, keys, messages):
+        """一批收件者可能跨頻道，依頻道分組後各自 multicast"""
+        groups = {}
+        for key in keys:
+            channel, user_id = self.resolve_key(key)
+            groups.setdefault(channel.name, (channel, []))[1].append(user_id)
+        for channel, user_ids in groups.values():
+            channel.line_bot_api.multicast(user_ids, messages)
+
+    def get_profile(self, key):
+        channel, user_id = self.resolve_key(key)
+        return channel.line_bot_api.get_profile(user_id)
+
+    def __iter__(self):
+        return iter(self.channels.values())
@@ -1,44 +1,110 @@
 import os
 import time
+import threading
 import requests
 from linebot.models import FlexSendMessage, TextSendMessage, TemplateSendMessage
 from backend.utils.member_utils import get_base_static_url
+from backend.utils.currency_registry import CurrencyRegistry, POPULAR_CURRENCIES
+from backend.utils.alert_book import AlertBook, ABOVE, BELOW
+from backend.utils.profiler import stage
+from .menu_api import get_main_menu_template
+
+# 已有專屬靜態圖片的幣種，其餘幣種使用預設圖
+CURRENCY_IMAGES = {
+    "USD": "image7.png",
+    "EUR": "image8.png",
+    "JPY": "image10.png",
+    "CNY": "image9.png",
+    "KRW": "image7.png"
+}
+DEFAULT_CURRENCY_IMAGE = "image7.png"
+CAROUSEL_PAGE_SIZE = 9  # carousel 最多 10 欄，保留一欄給「更多幣種」
+MORE_CURRENCIES_TEXT = "更多幣種"
+ALERT_TEXT = "到價提醒"
+ALERT_FILEPATH = os.path.join(os.path.dirname(__file__), "..", "members", "fx_alerts.json")
 
 class ForexManager:
-    def __init__(self):
+    def __init__(self, chart_manager=None, alert_filepath=ALERT_FILEPATH):
         self.user_states = {}
         self.base_currency = "TWD"
-        self.mock_rates = {}
+        self.rates = {}  # ISO 代碼 -> 1 台幣可換的外幣數
+        self.registry = CurrencyRegistry(self.base_currency)
         self.last_update = 0
-        self.update_interval = 24 * 60 * 60  # 24小時更新一次
+        self.update_interval = 24 * 60 * 60  # 24小時更新一次，由排程器定時呼叫 update_rates
+        self.chart_manager = chart_manager  # 背景產生走勢圖，可為 None
+        self.alert_book = AlertBook(alert_filepath)
+        self.alert_book.load()
+        self.notifier = None  # (user_id, messages) -> None，由 webhook_handler 設定為推播
+        self.on_subscribe = None  # (user_id, code) -> None，訂閱成功時通知會員資料
+        self.update_lock = threading.Lock()  # 排程器與請求端不會同時抓取匯率、重建索引與比對提醒
 
-    def update_rates(self):
-        now = time.time()
-        if now - self.last_update < self.update_interval and self.mock_rates:
+    def ensure_rates(self):
+        """請求端只在還沒有任何匯率時（啟動後首次更新前或更新一直失敗）才同步抓取"""
+        if self.rates:
             return
+        with self.update_lock:
+            if not self.rates:  # 等待期間排程器的更新可能已經完成
+                self._update_rates()
+
+    def update_rates(self):
+        with self.update_lock:
+            self._update_rates()
 
+    def _update_rates(self):
+        now = time.time()
         url = f"https://open.er-api.com/v6/latest/{self.base_currency}"
         try:
-            resp = requests.get(url, timeout=10)
+            with stage("fx_refresh"):
+                resp = requests.get(url, timeout=10)
             data = resp.json()
             if data.get("result") == "success":
                 rates = data.get("rates", {})
-                self.mock_rates = {
-                    "美元": rates.get("USD"),
-                    "日圓": rates.get("JPY"),
-                    "歐元": rates.get("EUR"),
-                    "人民幣": rates.get("CNY"),
-                    "韓元": rates.get("KRW")
-                }
+                self.registry.build(code for code, v in rates.items() if v)
+                self.rates = {code: rates[code] for code in self.registry.codes}
                 self.last_update = now
-                print("[ForexManager] 匯率自動更新成功:", self.mock_rates)
+                print(f"[ForexManager] 匯率自動更新成功: {len(self.rates)} 種幣別")
+                if self.chart_manager:
+                    # 只替熱門幣種畫走勢圖，其餘幣種使用預設圖
+                    self.chart_manager.refresh(
+                        {code: self.rates[code] for code in POPULAR_CURRENCIES if code in self.rates}, now
+                    )
+                self.check_alerts()
             else:
                 print("[ForexManager] 匯率API返回錯誤:", data)
         except Exception as e:
             print("[ForexManager] 匯率更新異常:", e)
 
+    def check_alerts(self):
+        """匯率更新後比對到價提醒，同一用戶這次觸發的提醒合併成一則推播"""
+        triggered = self.alert_book.match_all(self.rates)
+        if not triggered:
+            return
+        print(f"[ForexManager] 到價提醒觸發 {len(triggered)} 位用戶")
+        for user_id, alerts in triggered.items():
+            lines = []
+            for code, direction, threshold in alerts:
+                name = self.registry.display_name(code)
+                op = "≥" if direction == ABOVE else "≤"
+                lines.append(f"1 台幣 {op} {threshold:g} {name}（目前 {self.rates[code]:.4f}）")
+            if not self.notifier:
+                continue
+            try:
+                self.notifier(user_id, [TextSendMessage(text="🔔 到價提醒\n" + "\n".join(lines))])
+            except Exception as e:
+                print(f"[ForexManager] 推播到價提醒失敗 user_id={user_id}: {e}")
+        self.alert_book.save()
+
+    def subscribe_alert(self, user_id, code, threshold):
+        """目標高於目前匯率時等匯率漲到門檻，否則等匯率跌到門檻"""
+        direction = ABOVE if threshold > self.rates[code] else BELOW
+        self.alert_book.subscribe(user_id, code, threshold, direction)
+        self.alert_book.save()
+        if self.on_subscribe:
+            self.on_subscribe(user_id, code)
+        return direction
+
     def start_forex(self, user_id):
-        self.update_rates()
+        self.ensure_rates()
         self.user_states[user_id] = {"step": 1}
         flex_json = {
         "type": "bubble",
@@ -87,10 +153,7 @@ class ForexManager:
         return [FlexSendMessage(alt_text="選擇換算方式", contents=flex_json)]
 
     def process_forex(self, user_id, text):
-        # 延遲匯入，避免環狀導入錯誤
-        from backend.handlers.webhook_handler import get_main_menu_template
-
-        self.update_rates()
+        self.ensure_rates()
         state = self.user_states.get(user_id, {"step": 1})
         step = state.get("step", 1)
         text = text.strip()
@@ -99,231 +162,205 @@ class ForexManager:
         if not base_url.endswith("/"):
             base_url += "/"
 
-        currency_images = {
-            "美元": base_url + "image7.png",
-            "歐元": base_url + "image8.png",
-            "日圓": base_url + "image10.png",
-            "人民幣": base_url + "image9.png",
-            "韓元": base_url + "image7.png"
-        }
         print(f'[DEBUG] 目前{base_url}image7.png')
 
+        # 「主選單」（rich menu 或快速回覆）在任何步驟都能離開外幣換算；只有這裡會清掉狀態
+        if text == "主選單":
+            self.user_states.pop(user_id, None)
+            return get_main_menu_template()
+
+        # rich menu 的換算方式按鈕在任何步驟都可能被點選，直接重新選幣種
+        if step in (2, 3, 5) and text in ["台幣換外幣", "外幣換台幣"]:
+            step = 4
+
         if step == 1:
             if text not in ["台幣換外幣", "外幣換台幣"]:
-                # 用 flex message 重新發送選擇按鈕，提升 UX
-                flex_json = {
-                "type": "bubble",
-                "body": {
-                    "type": "box",
-                    "layout": "vertical",
-                    "spacing": "md",
-                    "contents": [
-                    {
-                        "type": "text",
-                        "text": "請從按鈕選擇『台幣換外幣』或『外幣換台幣』",
-                        "wrap": True,
-                        "weight": "bold",
-                        "gravity": "center",
-                        "size": "lg"
-                    },
-                    {
-                        "type": "box",
-                        "layout": "vertical",
-                        "contents": [
-                        {
-                            "type": "button",
-                            "style": "primary",
-                            "action": {
-                            "type": "message",
-                            "label": "台幣換外幣",
-                            "text": "台幣換外幣"
-                            }
-                        },
-                        {
-                            "type": "button",
-                            "style": "secondary",
-                            "action": {
-                            "type": "message",
-                            "label": "外幣換台幣",
-                            "text": "外幣換台幣"
-                            }
-                        }
-                        ],
-                        "spacing": "md"
-                    }
-                    ],
-                    "paddingAll": "xl"
-                }
-                }
-        
-                return [FlexSendMessage(alt_text="請選擇換算方式", contents=flex_json)]
+                # 上一則已有按鈕卡，重新提示只回短訊息加快速回覆
+                return self.reprompt_type()
 
             state["type"] = text
             state["step"] = 2
+            state["page"] = 0
             self.user_states[user_id] = state
-
-            columns = []
-            for currency, img_url in currency_images.items():
-                columns.append({
-                    "thumbnailImageUrl": img_url,
-                    "title": f"兌換{currency}服務",
-                    "text": currency,
-                    "actions": [
-                        {"type": "message", "label": f"兌換{currency}", "text": currency}
-                    ]
-                })
-
-            template_json = {
-                "type": "carousel",
-                "imageAspectRatio": "square",
-                "columns": columns
-            }
-            return [TemplateSendMessage(alt_text="選擇幣種", template=template_json)]
+            return self.build_currency_carousel(0, base_url)
 
         elif step == 2:
-            if text not in self.mock_rates or self.mock_rates[text] is None:
-                rates_list = ", ".join([k for k, v in self.mock_rates.items() if v is not None])
-                return [TextSendMessage(text=f"我們目前支援的幣種為：{rates_list}，請重新輸入。")]
+            if text == MORE_CURRENCIES_TEXT:
+                state["page"] = (state.get("page", 0) + 1) % self.registry.page_count(CAROUSEL_PAGE_SIZE)
+                self.user_states[user_id] = state
+                return self.build_currency_carousel(state["page"], base_url)
 
-            state["currency"] = text
-            state["step"] = 3
+            # 接受「美金」、「usd 50」、「100日幣」等自由輸入
+            code, amount = self.registry.parse(text)
+            if code is None or code not in self.rates:
+                names = "、".join(self.registry.display_name(c) for c in self.registry.page(0, CAROUSEL_PAGE_SIZE))
+                return [TextSendMessage(text=f"找不到此幣種。常用幣種有：{names}，也可以輸入幣別代碼（例如 USD、JPY），請重新輸入。")]
+
+            state["currency"] = code
             self.user_states[user_id] = state
-            prompt_currency = "台幣" if state["type"] == "台幣換外幣" else text
+            if amount is not None and amount > 0:
+                if state["type"] == "台幣換外幣" and not self.registry.mentions_base(text):
+                    # 「100美金」的金額跟著外幣寫，指的是 100 美金而非 100 台幣，改以外幣換台幣計算
+                    state["type"] = "外幣換台幣"
+                return self.build_result(user_id, state, amount)
+
+            state["step"] = 3
+            prompt_currency = "台幣" if state["type"] == "台幣換外幣" else self.registry.display_name(code)
+            if amount is not None:
+                return [TextSendMessage(text=f"金額需為正數，請重新輸入您要換算的金額（{prompt_currency}）：")]
             return [TextSendMessage(text=f"請輸入您要換算的金額（{prompt_currency}）：")]
 
         elif step == 3:
-            try:
-                amount = float(text)
-                if amount <= 0:
-                    raise ValueError()
-            except:
+            _, amount = self.registry.parse(text)
+            if amount is None or amount <= 0:
                 return [TextSendMessage(text="請輸入有效的正數金額，請重新輸入。")]
-
-            ctype = state["type"]
-            currency = state["currency"]
-            rate = self.mock_rates[currency]
-
-            if ctype == "台幣換外幣":
-                converted = amount * rate
-                msg1 = f"金額{amount} 台幣"
-                msg2 = f"可換{converted:.2f} {currency}"
-            else:
-                converted = amount / rate
-                msg1 = f"金額{amount} {currency} "
-                msg2 = f"可換{converted:.2f} 台幣"
-
-            flex_json = {
-                "type": "bubble",
-                "body": {
-                    "type": "box", "layout": "vertical",
-                    "contents": [
-                        {"type": "text", "text": msg1, "weight": "bold", "size": "lg"},
-                        {"type": "text", "text": msg2, "weight": "bold", "size": "lg"},
-                        {"type": "text", "text": f"今日匯率：1 台幣 = {rate:.4f} {currency}", "size": "sm"}
-                    ]
-                },
-                "footer": {
-                    "type": "box", "layout": "vertical",
-                    "contents": [
-                        {
-                            "type": "button",
-                            "style": "primary",
-                            "action": {"type": "message", "label": "繼續換匯", "text": "台幣換外幣"},
-                            "offsetBottom": "md"
-                        },
-                        {
-                            "type": "button",
-                            "style": "secondary",
-                            "action": {"type": "message", "label": "回主選單", "text": "主選單"}
-                        }
-                    ]
-                }
-            }
-            print(flex_json)
-            state["step"] = 4
-            self.user_states[user_id] = state
-            return [FlexSendMessage(alt_text="換算結果", contents=flex_json)]
+            return self.build_result(user_id, state, amount)
 
         elif step == 4:
             if text in ["台幣換外幣", "外幣換台幣"]:
                 state["step"] = 2
                 state["type"] = text
+                state["page"] = 0
                 self.user_states[user_id] = state
+                return self.build_currency_carousel(0, base_url)
 
-                columns = []
-                for currency, img_url in currency_images.items():
-                    columns.append({
-                        "thumbnailImageUrl": img_url,
-                        "title": f"兌換{currency}服務",
-                        "text": currency,
-                        "actions": [
-                            {"type": "message", "label": f"兌換{currency}", "text": currency}
-                        ]
-                    })
-
-                template_json = {
-                    "type": "carousel",
-                    "imageAspectRatio": "square",
-                    "columns": columns
-                }
-                return [TemplateSendMessage(alt_text="選擇幣種", template=template_json)]
+            elif text == ALERT_TEXT and state.get("currency") in self.rates:
+                code = state["currency"]
+                state["step"] = 5
+                self.user_states[user_id] = state
+                return [TextSendMessage(
+                    text=f"目前 1 台幣 = {self.rates[code]:.4f} {self.registry.display_name(code)}，"
+                         f"請輸入目標匯率（1 台幣可換多少{self.registry.display_name(code)}）："
+                )]
 
-            elif text == "主選單":
-                if user_id in self.user_states:
-                    del self.user_states[user_id]
-                from backend.handlers.webhook_handler import get_main_menu_template
-                return get_main_menu_template()
             else:
-                # 用 Flex 的按鈕卡再問一次
-                flex_json = {
-                "type": "bubble",
-                "body": {
-                    "type": "box",
-                    "layout": "vertical",
-                    "spacing": "md",
-                    "contents": [
-                    {
-                        "type": "text",
-                        "text": "請從按鈕選擇『台幣換外幣』或『外幣換台幣』",
-                        "wrap": True,
-                        "weight": "bold",
-                        "gravity": "center",
-                        "size": "lg"
-                    },
-                    {
-                        "type": "box",
-                        "layout": "vertical",
-                        "contents": [
-                        {
-                            "type": "button",
-                            "style": "primary",
-                            "action": {
-                            "type": "message",
-                            "label": "台幣換外幣",
-                            "text": "台幣換外幣"
-                            }
-                        },
-                        {
-                            "type": "button",
-                            "style": "secondary",
-                            "action": {
-                            "type": "message",
-                            "label": "外幣換台幣",
-                            "text": "外幣換台幣"
-                            }
-                        }
-                        ],
-                        "spacing": "md"
-                    }
-                    ],
-                    "paddingAll": "xl"
-                }
-                }
-                return [FlexSendMessage(alt_text="選擇換算方式", contents=flex_json)]
+                return self.reprompt_type()
+
+        elif step == 5:
+            _, threshold = self.registry.parse(text)
+            if threshold is None or threshold <= 0:
+                return [TextSendMessage(text="請輸入有效的正數匯率，請重新輸入。")]
+            code = state["currency"]
+            direction = self.subscribe_alert(user_id, code, threshold)
+            op = "≥" if direction == ABOVE else "≤"
+            # 回到結果頁狀態，讓結果卡片上的按鈕繼續有效
+            state["step"] = 4
+            self.user_states[user_id] = state
+            return [TextSendMessage(
+                text=f"已設定到價提醒：1 台幣 {op} {threshold:g} {self.registry.display_name(code)} 時通知您。"
+            )]
 
         else:
             self.user_states[user_id] = {"step": 1}
             return [TextSendMessage(text="流程錯誤，重新開始。請輸入『台幣換外幣』或『外幣換台幣』")]
 
+    def is_reprompt(self, user_id, text):
+        """此輸入是否只會得到「請選擇換算方式」的重新提示，供導覽事件統計"""
+        step = self.user_states.get(user_id, {"step": 1}).get("step", 1)
+        if step == 1:
+            return text not in ["台幣換外幣", "外幣換台幣", "主選單"]
+        if step == 4:
+            return text not in ["台幣換外幣", "外幣換台幣", "主選單", ALERT_TEXT]
+        return False
+
+    def reprompt_type(self):
+        from backend.handlers.richmenu_api import attach_quick_reply
+        return attach_quick_reply(
+            [TextSendMessage(text="請選擇『台幣換外幣』或『外幣換台幣』")],
+            ("台幣換外幣", "台幣換外幣"), ("外幣換台幣", "外幣換台幣"), ("回主選單", "主選單")
+        )
+
+    def build_currency_carousel(self, page, base_url):
+        """依熱門程度分頁列出幣種，最後一欄切換到下一頁"""
+        if not self.rates:
+            # 匯率還沒抓到時幣種清單是空的，零欄的 carousel 會被 LINE 拒絕
+            return [TextSendMessage(text="目前無法取得匯率資料，請稍後再試。")]
+        columns = []
+        for code in self.registry.page(page, CAROUSEL_PAGE_SIZE):
+            name = self.registry.display_name(code)
+            img_url = None
+            if self.chart_manager:
+                img_url = self.chart_manager.get_chart_url(code, base_url)
+            if not img_url:
+                img_url = base_url + CURRENCY_IMAGES.get(code, DEFAULT_CURRENCY_IMAGE)
+            columns.append({
+                "thumbnailImageUrl": img_url,
+                "title": f"兌換{name}服務",
+                "text": f"{name} {code}" if name != code else code,
+                "actions": [
+                    {"type": "message", "label": f"兌換{name}", "text": code}
+                ]
+            })
+
+        if self.registry.page_count(CAROUSEL_PAGE_SIZE) > 1:
+            columns.append({
+                "thumbnailImageUrl": base_url + DEFAULT_CURRENCY_IMAGE,
+                "title": "更多幣種",
+                "text": f"第 {page + 1}/{self.registry.page_count(CAROUSEL_PAGE_SIZE)} 頁",
+                "actions": [
+                    {"type": "message", "label": "下一頁", "text": MORE_CURRENCIES_TEXT}
+                ]
+            })
+
+        template_json = {
+            "type": "carousel",
+            "imageAspectRatio": "square",
+            "columns": columns
+        }
+        return [TemplateSendMessage(alt_text="選擇幣種", template=template_json)]
+
+    def build_result(self, user_id, state, amount):
+        ctype = state["type"]
+        code = state["currency"]
+        currency = self.registry.display_name(code)
+        rate = self.rates[code]
+
+        if ctype == "台幣換外幣":
+            converted = amount * rate
+            msg1 = f"金額{amount} 台幣"
+            msg2 = f"可換{converted:.2f} {currency}"
+        else:
+            converted = amount / rate
+            msg1 = f"金額{amount} {currency} "
+            msg2 = f"可換{converted:.2f} 台幣"
+
+        flex_json = {
+            "type": "bubble",
+            "body": {
+                "type": "box", "layout": "vertical",
+                "contents": [
+                    {"type": "text", "text": msg1, "weight": "bold", "size": "lg"},
+                    {"type": "text", "text": msg2, "weight": "bold", "size": "lg"},
+                    {"type": "text", "text": f"今日匯率：1 台幣 = {rate:.4f} {currency}", "size": "sm"}
+                ]
+            },
+            "footer": {
+                "type": "box", "layout": "vertical",
+                "contents": [
+                    {
+                        "type": "button",
+                        "style": "primary",
+                        "action": {"type": "message", "label": "繼續換匯", "text": "台幣換外幣"},
+                        "offsetBottom": "md"
+                    },
+                    {
+                        "type": "button",
+                        "style": "secondary",
+                        "action": {"type": "message", "label": "設定到價提醒", "text": ALERT_TEXT}
+                    },
+                    {
+                        "type": "button",
+                        "style": "secondary",
+                        "action": {"type": "message", "label": "回主選單", "text": "主選單"}
+                    }
+                ]
+            }
+        }
+        print(flex_json)
+        state["step"] = 4
+        self.user_states[user_id] = state
+        return [FlexSendMessage(alt_text="換算結果", contents=flex_json)]
+
     def is_done(self, user_id):
-        return user_id not in self.user_states or self.user_states[user_id].get("step") == 1
+        # 只有 process_forex 清掉狀態（選「主選單」）才算離開；停在第 1 步時仍留在外幣模式，快速回覆按鈕才有效
+        return user_id not in self.user_states
@@ -0,0 +1,45 @@
+from linebot.models import TemplateSendMessage, CarouselTemplate, CarouselColumn, MessageAction
+
+from backend.utils.json_codec import PayloadCache
+from backend.utils.member_utils import get_base_static_url
+
+# 主選單由各功能模組共用，獨立成模組，功能模組不必反向依賴 webhook_handler
+payload_cache = PayloadCache()  # 主選單等固定內容的預先序列化結果
+
+
+def get_main_menu_template():
+    """主選單內容只隨 BASE_STATIC_URL 變動，依網址快取序列化後的結果"""
+    base_url = get_base_static_url()
+    return [payload_cache.get(("main_menu", base_url), lambda: build_main_menu(base_url))]
+
+
+def build_main_menu(base_url):
+    print(f"[DEBUG] 目前 BASE_STATIC_URL：{base_url}")
+
+    columns = [
+        CarouselColumn(
+            thumbnail_image_url=base_url + "image3.png",
+            title="💱外幣換算服務",
+            text="小金可以幫我換算匯率唷！",
+            actions=[MessageAction(label="我要換算外幣", text="💱 外幣換算")]
+        ),
+        CarouselColumn(
+            thumbnail_image_url=base_url + "image4.png",
+            title="📚 金融小學堂",
+            text="小金金融業務認證",
+            actions=[MessageAction(label="我要認證考", text="📚 金融小學堂")]
+        ),
+        CarouselColumn(
+            thumbnail_image_url=base_url + "image5.png",
+            title="֍金融AI客服服務",
+            text="可以問問小金金融相關問題唷",
+            actions=[MessageAction(label="我要詢問小金AI", text="☺︎ 詢問AI")]
+        ),
+    ]
+    print(f'[DEBUG] 目前{base_url}image4.png')
+    template = CarouselTemplate(
+        columns=columns,
+        image_aspect_ratio="rectangle",
+        image_size="cover"
+    )
+    return TemplateSendMessage(alt_text="歡迎選單", template=template)
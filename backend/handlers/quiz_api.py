@@ -2,39 +2,14 @@ import os
 import json
 import random
 
-from linebot.models import TextSendMessage, FlexSendMessage, TemplateSendMessage, CarouselTemplate, CarouselColumn, MessageAction
-from backend.utils.member_utils import get_base_static_url
-
-
-def get_main_menu_template():
-    base_url = get_base_static_url()
-    columns = [
-        CarouselColumn(
-            thumbnail_image_url=base_url + "image3.png",
-            title="💱外幣換算服務",
-            text="小金可以幫我換算匯率唷！",
-            actions=[MessageAction(label="我要換算外幣", text="💱 外幣換算")]
-        ),
-        CarouselColumn(
-            thumbnail_image_url=base_url + "image4.png",
-            title="📚 金融小學堂",
-            text="小金金融業務認證",
-            actions=[MessageAction(label="我要認證考", text="📚 金融小學堂")]
-        ),
-        CarouselColumn(
-            thumbnail_image_url=base_url + "image5.png",
-            title="֍金融AI客服服務",
-            text="可以問問小金金融相關問題唷",
-            actions=[MessageAction(label="我要詢問小金AI", text="☺︎ 詢問AI")]
-        ),
-    ]
-    print(f'[DEBUG] 目前{base_url}image4.png')
-    template = CarouselTemplate(columns=columns, image_aspect_ratio="rectangle", image_size="cover")
-    return [TemplateSendMessage(alt_text="歡迎選單", template=template)]
+from linebot.models import TextSendMessage, FlexSendMessage
+from backend.utils.quiz_analytics import QuizAnalytics
+from backend.utils.profiler import stage
+from .menu_api import get_main_menu_template
 
 
 class QuizManager:
-    def __init__(self, quiz_filepath, template_filepath):
+    def __init__(self, quiz_filepath, template_filepath, analytics=None):
         self.quiz_filepath = quiz_filepath
         self.template_filepath = template_filepath
         self.questions_data = self.load_quiz()  # 載入題庫資料，要使用的是 self.questions_data
@@ -42,6 +17,8 @@ class QuizManager:
         self.user_question_order = {}  # user_id -> 亂數題目索引列表
         self.levels = ["一般會員", "初級金融", "高級金融", "菁英金融"]
         self.last_upgrade_level = {}
+        self.analytics = analytics or QuizAnalytics()
+        self.last_graded = {}  # user_id -> {"correct": bool, "passed": bool 或 None}，供更新會員 quiz_record
 
     def load_quiz(self):
         if not os.path.exists(self.quiz_filepath):
@@ -79,7 +56,8 @@ class QuizManager:
         question_obj = self.get_question(level, index, user_id)
         if not question_obj:
             return self.end_quiz(user_id)
-        bubble = self.render_flex_bubble(question_obj, index, level)
+        with stage("render_flex_bubble"):
+            bubble = self.render_flex_bubble(question_obj, index, level)
         return [FlexSendMessage(alt_text="金融考題", contents=bubble)]
 
     def get_question(self, level, index, user_id):
@@ -111,12 +89,17 @@ class QuizManager:
         level = progress["level"]
         index = progress["index"]
 
-        if self.check_answer(level, index, user_answer, user_id):
+        question = self.get_question(level, index, user_id)
+        is_correct = self.check_answer(level, index, user_answer, user_id)
+        if is_correct:
             progress["correct_count"] += 1
             reply = TextSendMessage(text="答對了！🎉")
         else:
-            correct_ans = self.get_question(level, index, user_id)["answer"]
+            correct_ans = question["answer"]
             reply = TextSendMessage(text=f"答錯了！正確答案是：{correct_ans}")
+        if question:
+            self.analytics.record_answer(user_id, level, question["question"], is_correct)
+        self.last_graded[user_id] = {"correct": is_correct, "passed": None}
 
         progress["index"] += 1
 
@@ -130,6 +113,10 @@ class QuizManager:
 
             main_menu_msgs = get_main_menu_template()
 
+            passed = correct / total >= 0.9
+            self.analytics.record_result(user_id, level, passed)
+            self.last_graded[user_id]["passed"] = passed
+
             if correct / total >= 0.9 and level_num < len(self.levels) - 1:
                 next_level = self.levels[level_num + 1]
                 self.last_upgrade_level[user_id] = next_level
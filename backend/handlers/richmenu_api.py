@@ -0,0 +1,216 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+from linebot.models import RichMenu, RichMenuAlias, QuickReply, QuickReplyButton, MessageAction
+
+from backend.utils import json_codec
+from backend.utils.json_codec import RawPayload
+
+RICH_MENU_SPEC_PATH = os.path.join(os.path.dirname(__file__), "..", "members", "rich_menus.json")
+RICH_MENU_STATE_PATH = os.path.join(os.path.dirname(__file__), "..", "members", "rich_menus_state.json")
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "..", "static")
+# 產生預設圖片用的字型檔；未設定時依序嘗試已安裝的中文字型
+RICH_MENU_FONT = os.getenv("RICH_MENU_FONT")
+CJK_FONTS = ("Noto Sans CJK TC", "Noto Sans TC", "Microsoft JhengHei", "PingFang TC", "Heiti TC",
+             "WenQuanYi Zen Hei", "Arial Unicode MS")
+AREA_COLORS = ("#1DB446", "#2C7BE5", "#F5A623", "#7B61FF")
+
+
+def quick_reply(*items):
+    """items 為 (label, text)，產生附在訊息上的快速回覆按鈕"""
+    return QuickReply(items=[
+        QuickReplyButton(action=MessageAction(label=label, text=text)) for label, text in items
+    ])
+
+
+def attach_quick_reply(messages, *items):
+    """快速回覆只會顯示在最後一則訊息上"""
+    if not messages:
+        return messages
+    last = messages[-1]
+    if isinstance(last, RawPayload):
+        # 快取的預先序列化訊息（例如主選單）是共用物件，不能修改，改放附帶快速回覆的副本
+        data = last.as_json_dict()
+        data["quickReply"] = quick_reply(*items).as_json_dict()
+        messages[-1] = RawPayload(json_codec.dumps(data))
+    else:
+        last.quick_reply = quick_reply(*items)
+    return messages
+
+
+def render_menu_image(menu, path):
+    """依 rich menu 設定畫出每個點擊區塊的色塊與標籤，圖片尺寸與 menu["size"] 相同"""
+    from matplotlib import font_manager
+    from matplotlib.figure import Figure
+    from matplotlib.patches import Rectangle
+
+    if RICH_MENU_FONT:
+        font_manager.fontManager.addfont(RICH_MENU_FONT)
+        font = font_manager.FontProperties(fname=RICH_MENU_FONT).get_name()
+    else:
+        installed = {f.name for f in font_manager.fontManager.ttflist}
+        font = next((name for name in CJK_FONTS if name in installed), None)
+    if font is None:
+        # 沒有中文字型時標籤只會是方框，寧可不建立 rich menu
+        raise RuntimeError("找不到中文字型，請安裝 Noto Sans CJK 或以 RICH_MENU_FONT 指定字型檔")
+
+    width, height = menu["size"]["width"], menu["size"]["height"]
+    fig = Figure(figsize=(width / 100, height / 100), dpi=100)
+    ax = fig.add_axes((0, 0, 1, 1))
+    ax.set_xlim(0, width)
+    ax.set_ylim(height, 0)  # rich menu 的座標原點在左上角
+    ax.axis("off")
+    for i, area in enumerate(menu["areas"]):
+        b = area["bounds"]
+        ax.add_patch(Rectangle((b["x"], b["y"]), b["width"], b["height"],
+                               facecolor=AREA_COLORS[i % len(AREA_COLORS)], edgecolor="white", linewidth=8))
+        label = area["action"].get("label") or area["action"].get("text", "")
+        ax.text(b["x"] + b["width"] / 2, b["y"] + b["height"] / 2, label, ha="center", va="center",
+                color="white", fontsize=72, fontweight="bold", fontfamily=font)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    # 不寫入版本等中繼資料，同樣的設定畫出相同的位元組，digest 才不會每次都變
+    fig.savefig(tmp_path, format="png", metadata={"Software": None})
+    os.replace(tmp_path, path)
+
+
+class RichMenuManager:
+    def __init__(self, spec_path=RICH_MENU_SPEC_PATH, state_path=RICH_MENU_STATE_PATH, static_dir=STATIC_DIR):
+        self.spec_path = spec_path
+        self.state_path = state_path
+        self.static_dir = static_dir
+        self.spec = self.load_json(spec_path)
+        self.state = self.load_json(state_path)  # mode -> {"rich_menu_id", "digest"}
+        self.linked = {}  # user_id -> 目前已連結的 mode，避免重複呼叫 API
+        # 未個別連結的用戶看到的是預設 rich menu
+        self.default_mode = next((m for m, e in self.spec.items() if e.get("default")), None)
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        self.line_bot_api = None
+        self.active = False  # 所有模式都已建立 rich menu 才算啟用，統計導覽比例時用來區分前後
+
+    @staticmethod
+    def load_json(path):
+        if not os.path.isfile(path):
+            return {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"[RichMenuManager] 讀取 {path} 失敗：{e}")
+            return {}
+
+    def save_state(self):
+        try:
+            with open(self.state_path, "w", encoding="utf-8") as f:
+                json.dump(self.state, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            print(f"[RichMenuManager] 儲存 rich menu 狀態失敗：{e}")
+
+    @staticmethod
+    def digest(entry, image_path):
+        h = hashlib.sha1(json.dumps(entry, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+        with open(image_path, "rb") as f:
+            h.update(f.read())
+        return h.hexdigest()
+
+    def provision(self, line_bot_api):
+        """依宣告式設定建立各模式的 rich menu 與 alias；設定與圖片沒變就沿用既有的 rich menu
+
+        圖片不存在時依設定產生有標籤的預設圖片，放入設計好的圖片（同檔名）即可取代
+        """
+        self.line_bot_api = line_bot_api
+        changed = False
+        missing = []
+        failed = []
+        for mode, entry in self.spec.items():
+            image_path = os.path.join(self.static_dir, entry["image"])
+            if not os.path.isfile(image_path):
+                try:
+                    render_menu_image(entry["menu"], image_path)
+                    print(f"[RichMenuManager] 已產生 {mode} 的預設圖片：{image_path}")
+                except Exception as e:
+                    print(f"[RichMenuManager] 產生 {mode} 的預設圖片失敗：{e}")
+                    missing.append(image_path)
+                    continue
+            digest = self.digest(entry, image_path)
+            current = self.state.get(mode)
+            if current and current.get("digest") == digest:
+                continue
+            try:
+                rich_menu_id = line_bot_api.create_rich_menu(RichMenu.new_from_json_dict(entry["menu"]))
+                content_type = "image/png" if image_path.endswith(".png") else "image/jpeg"
+                with open(image_path, "rb") as f:
+                    line_bot_api.set_rich_menu_image(rich_menu_id, content_type, f)
+                self.upsert_alias(line_bot_api, entry["alias"], rich_menu_id, current is not None)
+                if entry.get("default"):
+                    line_bot_api.set_default_rich_menu(rich_menu_id)
+                if current:
+                    line_bot_api.delete_rich_menu(current["rich_menu_id"])
+            except Exception as e:
+                print(f"[RichMenuManager] 建立 {mode} rich menu 失敗：{e}")
+                failed.append(mode)
+                continue
+            self.state[mode] = {"rich_menu_id": rich_menu_id, "digest": digest}
+            changed = True
+            print(f"[RichMenuManager] 已建立 {mode} rich menu：{rich_menu_id}")
+        if changed:
+            self.save_state()
+            self.linked.clear()
+        self.active = bool(self.spec) and not missing and not failed
+        if missing:
+            # 無法產生預設圖片（例如沒有 matplotlib）又沒有自備圖片時，只有快速回覆，rich menu 完全不會出現
+            print(f"[ERROR] rich menu 未啟用：缺少 {len(missing)} 張圖片（2500x843），請放到 "
+                  f"{os.path.join(self.static_dir, 'richmenu')}：" + "、".join(os.path.basename(p) for p in missing))
+
+    @staticmethod
+    def upsert_alias(line_bot_api, alias_id, rich_menu_id, exists):
+        if exists:
+            try:
+                line_bot_api.update_rich_menu_alias(alias_id, RichMenuAlias(rich_menu_id=rich_menu_id))
+                return
+            except Exception:
+                pass  # alias 可能已被手動刪除，改為重新建立
+        line_bot_api.create_rich_menu_alias(RichMenuAlias(rich_menu_alias_id=alias_id, rich_menu_id=rich_menu_id))
+
+    def link(self, user_id, mode):
+        """伺服器端切換模式時，在背景把對應 rich menu 連結給用戶，不佔用回覆時間"""
+        if self.line_bot_api is None or self.linked.get(user_id, self.default_mode) == mode:
+            return
+        rich_menu_id = self.state.get(mode, {}).get("rich_menu_id")
+        if not rich_menu_id:
+            return
+        self.linked[user_id] = mode
+        self.executor.submit(self._link, user_id, mode, rich_menu_id)
+
+    def reset(self, user_id, mode):
+        """伺服器端強制把用戶切回某模式（例如清理閒置狀態）；不依賴 linked 記錄，重啟後也能生效"""
+        if self.line_bot_api is None:
+            return
+        self.linked.pop(user_id, None)
+        if mode != self.default_mode:
+            self.link(user_id, mode)
+            return
+        # 取消個別連結後，用戶端會顯示預設 rich menu
+        self.linked[user_id] = mode
+        self.executor.submit(self._unlink, user_id)
+
+    def _unlink(self, user_id):
+        try:
+            self.line_bot_api.unlink_rich_menu_from_user(user_id)
+        except Exception as e:
+            self.linked.pop(user_id, None)
+            print(f"[RichMenuManager] 取消 rich menu 連結失敗 user_id={user_id}: {e}")
+
+    def _link(self, user_id, mode, rich_menu_id):
+        try:
+            self.line_bot_api.link_rich_menu_to_user(user_id, rich_menu_id)
+        except Exception as e:
+            self.linked.pop(user_id, None)
+            print(f"[RichMenuManager] 連結 {mode} rich menu 失敗 user_id={user_id}: {e}")
+
+    def switched(self, user_id, mode):
+        """用戶端以 richmenuswitch 自行切換，只需同步記錄"""
+        self.linked[user_id] = mode
@@ -1,33 +1,56 @@
 import os
-import json
+import time
+import atexit
+import threading
 import traceback
 
 from dotenv import load_dotenv
 load_dotenv()
 
-from linebot import LineBotApi, WebhookHandler
-from linebot.models import (
-    MessageEvent, TextMessage, TextSendMessage, FollowEvent,
-    FlexSendMessage, TemplateSendMessage, CarouselTemplate,
-    CarouselColumn, MessageAction,
-)
+from linebot.models import TextSendMessage, FlexSendMessage
 from linebot.exceptions import InvalidSignatureError
-from backend.utils.member_utils import get_base_static_url
+from backend.utils import json_codec
+from backend.utils.json_codec import LineEvent
+from backend.utils.chart_utils import ChartManager
+from backend.utils.metrics import metrics
+from backend.utils.state_log import StateLog
+from backend.utils.faq_index import FaqIndex
+from backend.utils.profile_service import ProfileService
+from backend.utils.profiler import stage, slow_events
+from backend.utils.scheduler import Scheduler, IntervalTrigger, CronTrigger
 
 # 功能管理器相對匯入，路徑請根據你的專案調整
 from .forex_api import ForexManager
 from .quiz_api import QuizManager
 from .ai_api import AIManager
+from .broadcast_api import BroadcastManager
+from .menu_api import get_main_menu_template
+from .richmenu_api import attach_quick_reply
+from .channel_api import Channel, ChannelRegistry, DEFAULT_CHANNEL
 
 
-# 全域物件
-line_bot_api: LineBotApi = None
-handler: WebhookHandler = None
+# 全域物件；以下的 user_id 皆為頻道命名空間下的狀態鍵值（預設頻道即為 LINE user_id）
+channel_registry = ChannelRegistry()
 user_states = {}  # user_id -> 狀態字串
 member_data_store = {}  # user_id -> 會員資料字典
+members_lock = threading.Lock()  # 背景回寫與請求端可能同時存檔
+members_dirty = threading.Event()  # 會員資料有尚未寫檔的異動
+last_active = {}  # user_id -> 最後一次事件時間，用於清理閒置狀態
+
+# 只負責切換畫面、不產生業務結果的指令，用於統計導覽事件比例
+NAVIGATION_TEXTS = {
+    "主選單", "結束提問", "💱 外幣換算", "📚 金融小學堂", "☺︎ 詢問AI",
+    "台幣換外幣", "外幣換台幣", "更多幣種",
+}
+MAIN_MENU_QUICK_REPLY = (("外幣換算", "💱 外幣換算"), ("金融小學堂", "📚 金融小學堂"), ("詢問AI", "☺︎ 詢問AI"))
 
 # 會員資料檔路徑（請依專案實際路徑修改）
 MEMBER_JSON_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'members.json')
+# 背景工作設定
+STATE_IDLE_TTL = int(os.getenv("STATE_IDLE_HOURS", "24")) * 60 * 60  # 閒置多久後流程狀態回到主選單
+STORE_FLUSH_SECONDS = int(os.getenv("STORE_FLUSH_SECONDS", "30"))  # 會員資料與統計快照的回寫間隔
+STATE_LOG_COMPACT_CRON = os.getenv("STATE_LOG_COMPACT_CRON", "30 4 * * *")
+SCHEDULER_BUSY_INFLIGHT = int(os.getenv("SCHEDULER_BUSY_INFLIGHT", "4"))  # 處理中 webhook 達此數時延後低優先工作
 
 
 def load_members():
@@ -35,29 +58,57 @@ def load_members():
         print("[INFO] 會員資料檔不存在，建立空資料")
         return {}
     try:
-        with open(MEMBER_JSON_PATH, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open(MEMBER_JSON_PATH, 'rb') as f:
+            data = json_codec.loads(f.read())
             print(f"[INFO] 載入會員資料 {len(data)} 筆")
             return data
     except Exception as e:
         print(f"[ERROR] 載入會員資料失敗：{e}")
         return {}
 
-def handle_body(body: str, signature: str):
+def handle_body(body: bytes, signature: str, channel_name: str = None):
+    """依路由找到頻道，先以原始位元組驗證簽章，通過後才解析（只解析一次）並依事件類型分派"""
     try:
-        handler.handle(body, signature)
+        channel = channel_registry.find(channel_name)
+        if channel is None:
+            raise InvalidSignatureError(f"Unknown channel. channel={channel_name}")
+        if not json_codec.verify_signature(channel.channel_secret, body, signature):
+            raise InvalidSignatureError(f"Invalid signature. signature={signature}")
+        _, events = json_codec.parse_events(body)
+        for event in events:
+            if not event.source.user_id:
+                # 群組、聊天室中未同意提供資料的發話者沒有 userId，無從建立狀態與會員資料
+                print(f"[INFO] 略過缺少 userId 的事件 type={event.type}, source={event.source.type}")
+                continue
+            event.channel = channel
+            func = EVENT_HANDLERS.get(event.type)
+            if func:
+                func(event)
     except InvalidSignatureError:
         print("Invalid signature. 中斷處理")
         raise
+    except json_codec.InvalidBodyError as e:
+        print(f"Webhook 內容格式錯誤：{e}")
+        raise
     except Exception as e:
         print(f"Webhook 處理錯誤：{e}")
         raise
 
+def mark_members_dirty():
+    """請求端只標記異動，由排程器的 flush_stores 合併寫檔"""
+    members_dirty.set()
+
+
 def save_members():
+    # 先清除標記再序列化，寫檔期間的新異動會留到下一輪
+    members_dirty.clear()
     try:
-        with open(MEMBER_JSON_PATH, 'w', encoding='utf-8') as f:
-            json.dump(member_data_store, f, ensure_ascii=False, indent=2)
+        with stage("save_members"):
+            data = json_codec.dumps(dict(member_data_store))
+            with members_lock, open(MEMBER_JSON_PATH, 'wb') as f:
+                f.write(data)
     except Exception as e:
+        members_dirty.set()
         print(f"[ERROR] 儲存會員資料失敗：{e}")
 
 
@@ -65,63 +116,202 @@ def save_members():
 member_data_store = load_members()
 
 # 建立 manager 實體（可依你的類別建構參數微調）
-forex_manager = ForexManager()
+chart_manager = ChartManager()
+forex_manager = ForexManager(chart_manager=chart_manager)
 quiz_manager = QuizManager(
     quiz_filepath="backend/members/quiz_questions.json",
     template_filepath="backend/members/question_bubble_template.json"
 )
-ai_manager = AIManager()
-
-
-def get_main_menu_template():
-    base_url = get_base_static_url()
-    print(f"[DEBUG] 目前 BASE_STATIC_URL：{base_url}")
-
-    columns = [
-        CarouselColumn(
-            thumbnail_image_url=base_url + "image3.png",
-            title="💱外幣換算服務",
-            text="小金可以幫我換算匯率唷！",
-            actions=[MessageAction(label="我要換算外幣", text="💱 外幣換算")]
-        ),
-        CarouselColumn(
-            thumbnail_image_url=base_url + "image4.png",
-            title="📚 金融小學堂",
-            text="小金金融業務認證",
-            actions=[MessageAction(label="我要認證考", text="📚 金融小學堂")]
-        ),
-        CarouselColumn(
-            thumbnail_image_url=base_url + "image5.png",
-            title="֍金融AI客服服務",
-            text="可以問問小金金融相關問題唷",
-            actions=[MessageAction(label="我要詢問小金AI", text="☺︎ 詢問AI")]
-        ),
-    ]
-    print(f'[DEBUG] 目前{base_url}image4.png')
-    template = CarouselTemplate(
-        columns=columns,
-        image_aspect_ratio="rectangle",
-        image_size="cover"
-    )
-    return [TemplateSendMessage(alt_text="歡迎選單", template=template)]
+ai_manager = AIManager(faq_index=FaqIndex.from_sources(quiz_manager.questions_data))
+# 收件者可能分屬不同頻道，由 channel_registry 分組送出
+broadcast_manager = BroadcastManager(member_data_store, send_func=channel_registry.multicast)
+state_log = StateLog()
+
+
+def backfill_profiles(batch):
+    """背景查到的暱稱與頭像整批寫回會員資料，只存檔一次"""
+    updated = 0
+    for user_id, profile in batch:
+        member = member_data_store.get(user_id)
+        if member is None:
+            continue
+        member["name"] = profile["name"]
+        member["picture_url"] = profile["picture_url"]
+        updated += 1
+    if updated:
+        mark_members_dirty()
+        print(f"[INFO] 回寫會員資料 {updated} 筆")
+
+
+profile_service = ProfileService(
+    fetch_func=channel_registry.get_profile,
+    on_batch=backfill_profiles
+)
+
+
+def capture_user_state(user_id):
+    """收集用戶在各管理器中的流程狀態，作為事件紀錄的內容"""
+    state = {
+        "mode": user_states.get(user_id),
+        "forex": forex_manager.user_states.get(user_id),
+        "quiz": quiz_manager.user_progress.get(user_id),
+        "order": quiz_manager.user_question_order.get(user_id),
+    }
+    if state["mode"] in (None, "main_menu"):
+        state.pop("mode")
+    return {k: v for k, v in state.items() if v is not None}
+
+
+def restore_user_states(states):
+    now = time.time()
+    for user_id, state in states.items():
+        last_active[user_id] = now  # 重啟前的閒置時間無從得知，從現在起算
+        if "mode" in state:
+            user_states[user_id] = state["mode"]
+        if "forex" in state:
+            forex_manager.user_states[user_id] = state["forex"]
+        if "quiz" in state:
+            quiz_manager.user_progress[user_id] = state["quiz"]
+        if "order" in state:
+            quiz_manager.user_question_order[user_id] = state["order"]
+
+
+# 重啟時從快照 + 尾端紀錄回復進行中的流程，避免用戶被丟回主選單
+restore_user_states(state_log.recover())
+
+
+def sweep_states():
+    """閒置超過 STATE_IDLE_TTL 的用戶回到主選單，並清掉閒置的 AI 對話"""
+    cutoff = time.time() - STATE_IDLE_TTL
+    swept = 0
+    for user_id in [user_id for user_id, t in list(last_active.items()) if t < cutoff]:
+        if last_active.get(user_id, 0) >= cutoff:
+            continue  # 清理途中用戶又有新事件
+        last_active.pop(user_id, None)
+        mode = user_states.pop(user_id, None)
+        if mode not in (None, "main_menu"):
+            # 用戶端的 rich menu 也要回到主選單，否則下一次點按鈕會落到主選單的 fallback
+            channel, line_user_id = channel_registry.resolve_key(user_id)
+            if channel:
+                channel.rich_menus.reset(line_user_id, "main_menu")
+        forex_manager.user_states.pop(user_id, None)
+        quiz_manager.user_progress.pop(user_id, None)
+        quiz_manager.user_question_order.pop(user_id, None)
+        state_log.append(user_id, {})
+        swept += 1
+    if swept:
+        print(f"[INFO] 清除閒置用戶狀態 {swept} 筆")
+    ai_manager.memory.sweep()
+
+
+def flush_stores():
+    if members_dirty.is_set():
+        save_members()
+    quiz_manager.analytics.snapshot()
+
+
+scheduler = Scheduler(load_func=lambda: metrics.gauge("webhook.inflight"), busy_threshold=SCHEDULER_BUSY_INFLIGHT)
+
+
+def start_scheduler():
+    """匯率更新、閒置狀態清理與資料回寫都交給排程器，不佔用請求處理時間"""
+    scheduler.add_job("fx_refresh", forex_manager.update_rates,
+                      IntervalTrigger(forex_manager.update_interval), jitter=60, run_now=True)
+    scheduler.add_job("state_sweep", sweep_states, IntervalTrigger(10 * 60), jitter=30,
+                      low_priority=True, max_defer=10 * 60)
+    scheduler.add_job("store_flush", flush_stores, IntervalTrigger(STORE_FLUSH_SECONDS), jitter=5,
+                      low_priority=True, max_defer=5 * 60)
+    scheduler.add_job("state_log_compact", state_log.compact, CronTrigger(STATE_LOG_COMPACT_CRON), jitter=5 * 60,
+                      low_priority=True, max_defer=60 * 60)
+    scheduler.start()
+    atexit.register(flush_stores)  # 正常結束時寫出最後一輪異動
 
 
 def init_line_bot(channel_secret, channel_access_token):
-    global line_bot_api, handler
-    line_bot_api = LineBotApi(channel_access_token)
-    handler = WebhookHandler(channel_secret)
+    """註冊預設頻道與 channels.json 中的其他頻道；每個頻道各自建立 rich menu"""
+    channel_registry.register(Channel(DEFAULT_CHANNEL, channel_secret, channel_access_token))
+    channel_registry.load_file()
+
+    forex_manager.notifier = channel_registry.push
+    forex_manager.on_subscribe = subscribe_currency
+    for channel in channel_registry:
+        channel.rich_menus.provision(channel.line_bot_api)
+    start_scheduler()
+
+
+def event_user_key(event):
+    return event.channel.state_key(event.source.user_id)
+
+
+def logged(func):
+    """事件處理完（不論成功與否）都記錄該用戶最新的流程狀態，並量測是否為慢事件"""
+    def wrapper(event):
+        user_id = event_user_key(event)
+        last_active[user_id] = time.time()
+        route = f"{event.channel.name}/{event.type}"
+        with slow_events.trace(route, user_states.get(user_id, "main_menu"), user_id):
+            try:
+                return func(event)
+            finally:
+                with stage("state_log"):
+                    state_log.append(user_id, capture_user_state(user_id))
+    wrapper.__name__ = func.__name__
+    return wrapper
+
+
+def reply(event, messages):
+    with stage("line_reply"):
+        event.channel.reply_client.reply(event.reply_token, messages)
+
+
+def set_state(user_id, mode):
+    """切換用戶模式，同時讓用戶端的 rich menu 跟著切換"""
+    user_states[user_id] = mode
+    channel, line_user_id = channel_registry.resolve_key(user_id)
+    if channel:
+        channel.rich_menus.link(line_user_id, mode)
+
+
+def richmenu_segment(user_id):
+    channel, _ = channel_registry.resolve_key(user_id)
+    return "richmenu_on" if channel and channel.rich_menus.active else "richmenu_off"
+
+
+def count_event(user_id, text, state):
+    """把事件分成導覽與業務兩類，並依該頻道 rich menu 是否啟用分開累計，比較上線前後的比例"""
+    segment = richmenu_segment(user_id)
+    if text in NAVIGATION_TEXTS:
+        route = "command"
+    elif state == "main_menu" and text != "開始作答" and not text.startswith(("繼續升級挑戰:", "再挑戰本級:")):
+        route = "fallback"
+    elif state == "forex_mode" and forex_manager.is_reprompt(user_id, text):
+        route = "forex_reprompt"
+    else:
+        metrics.incr("events.business")
+        metrics.incr(f"events.business.{state}")
+        metrics.incr(f"events.{segment}.business")
+        return
+    metrics.incr("events.navigation")
+    metrics.incr(f"events.navigation.{route}")
+    metrics.incr(f"events.{segment}.navigation")
 
-    handler.add(MessageEvent, message=TextMessage)(handle_message)
-    handler.add(FollowEvent)(handle_follow)
+
+def subscribe_currency(user_id, code):
+    """記錄會員訂閱的幣種，供群發推播依幣種挑選收件者"""
+    init_member(user_id)
+    currencies = member_data_store[user_id].setdefault("subscribed_currencies", [])
+    if code not in currencies:
+        currencies.append(code)
+        mark_members_dirty()
 
 
 def init_member(user_id, profile=None):
-    """初始化會員資料，避免KeyError"""
+    """初始化會員資料，避免KeyError；profile 為 ProfileService 快取的 {"name", "picture_url"}"""
     if user_id not in member_data_store:
         member_data_store[user_id] = {
             "user_id": user_id,
-            "name": profile.display_name if profile else "匿名",
-            "picture_url": profile.picture_url if profile else "",
+            "name": profile["name"] if profile else "匿名",
+            "picture_url": profile["picture_url"] if profile else "",
             "member_level": "一般會員",
             "quiz_record": {
                 "last_date": "",
@@ -130,27 +320,38 @@ def init_member(user_id, profile=None):
                 "passed_count": 0
             }
         }
-        save_members()
+        mark_members_dirty()
         print(f"[INFO] 初始化會員資料 user_id={user_id}")
 
 
-def handle_follow(event: FollowEvent):
-    user_id = event.source.user_id
-    try:
-        profile = line_bot_api.get_profile(user_id)
-    except Exception as e:
-        print(f"[取得用戶資料失敗]: {e}")
-        profile = None
+def update_quiz_record(user_id, graded):
+    record = member_data_store[user_id].setdefault("quiz_record", {
+        "last_date": "", "correct_count": 0, "total_count": 0, "passed_count": 0
+    })
+    record["total_count"] = record.get("total_count", 0) + 1
+    if graded["correct"]:
+        record["correct_count"] = record.get("correct_count", 0) + 1
+    if graded["passed"]:
+        record["passed_count"] = record.get("passed_count", 0) + 1
+    record["last_date"] = time.strftime("%Y-%m-%d")
+    mark_members_dirty()
+
 
-    init_member(user_id, profile)
+def handle_follow(event: LineEvent):
+    user_id = event_user_key(event)
+    # 不等個人資料查詢，先用快取（若有）建立會員並立即回覆，暱稱與頭像由背景補上
+    init_member(user_id, profile_service.get_cached(user_id))
+    profile_service.enrich(user_id)
 
+    name = member_data_store[user_id]["name"]
+    greeting = f"歡迎 {name} 加入！" if name != "匿名" else "歡迎加入！"
     welcome_flex = {
         "type": "bubble",
         "body": {
             "type": "box",
             "layout": "vertical",
             "contents": [
-                {"type": "text", "text": f"歡迎 {member_data_store[user_id]['name']} 加入！", "weight": "bold", "size": "lg", "wrap": True},
+                {"type": "text", "text": greeting, "weight": "bold", "size": "lg", "wrap": True},
                 {"type": "text", "text": "您已成為「一般會員」，祝您使用愉快！", "margin": "md", "wrap": True}
             ]
         }
@@ -159,23 +360,26 @@ def handle_follow(event: FollowEvent):
     main_menu_msgs = get_main_menu_template()
 
     reply_msgs = [FlexSendMessage(alt_text="歡迎加入", contents=welcome_flex)] + main_menu_msgs
-    line_bot_api.reply_message(event.reply_token, reply_msgs)
+    reply(event, reply_msgs)
 
-    user_states[user_id] = "main_menu"
+    set_state(user_id, "main_menu")
 
 
-def handle_message(event: MessageEvent):
-    user_id = event.source.user_id
-    msg = event.message
+def handle_message(event: LineEvent):
+    user_id = event_user_key(event)
 
-    if not isinstance(msg, TextMessage):
-        print(f"[非文字訊息] user_id={user_id}, type={type(msg)}，略過")
+    if event.message_type != "text":
+        print(f"[非文字訊息] user_id={user_id}, type={event.message_type}，略過")
         return
 
-    text = msg.text.strip()
+    text = event.text.strip()
+    count_event(user_id, text, user_states.get(user_id, "main_menu"))
 
     if user_id not in member_data_store:
         init_member(user_id)
+    if member_data_store[user_id].get("name") == "匿名":
+        # 先前未取得個人資料的會員，背景補查（失敗會快取一段時間，不會每則訊息都查）
+        profile_service.enrich(user_id)
 
     reply_msgs = []  # 先初始化，避免 append 錯誤
 
@@ -188,10 +392,10 @@ def handle_message(event: MessageEvent):
             "correct_count": 0,
         }
         member_data_store[user_id]["member_level"] = next_level
-        save_members()
-        user_states[user_id] = "quiz_mode"
+        mark_members_dirty()
+        set_state(user_id, "quiz_mode")
         reply_msgs = quiz_manager.send_question(user_id)
-        line_bot_api.reply_message(event.reply_token, reply_msgs)
+        reply(event, reply_msgs)
         return
 
     if text.startswith("再挑戰本級:"):
@@ -201,9 +405,9 @@ def handle_message(event: MessageEvent):
             "index": 0,
             "correct_count": 0,
         }
-        user_states[user_id] = "quiz_mode"
+        set_state(user_id, "quiz_mode")
         reply_msgs = quiz_manager.send_question(user_id)
-        line_bot_api.reply_message(event.reply_token, reply_msgs)
+        reply(event, reply_msgs)
         return
 
     if text == "開始作答":
@@ -215,9 +419,9 @@ def handle_message(event: MessageEvent):
                 "index": 0,
                 "correct_count": 0,
             }
-        user_states[user_id] = "quiz_mode"
+        set_state(user_id, "quiz_mode")
         reply_msgs = quiz_manager.send_question(user_id)
-        line_bot_api.reply_message(event.reply_token, reply_msgs)
+        reply(event, reply_msgs)
         return
 
     state = user_states.get(user_id, "main_menu")
@@ -226,29 +430,31 @@ def handle_message(event: MessageEvent):
     # 主選單狀態
     if state == "main_menu":
         if text == "💱 外幣換算":
-            user_states[user_id] = "forex_mode"
+            set_state(user_id, "forex_mode")
             reply_msgs = forex_manager.start_forex(user_id)
-            line_bot_api.reply_message(event.reply_token, reply_msgs)
+            reply(event, reply_msgs)
             return
 
         elif text == "📚 金融小學堂":
-            user_states[user_id] = "quiz_mode"
+            set_state(user_id, "quiz_mode")
             level = member_data_store.get(user_id, {}).get("member_level", "一般會員")
             reply_msgs = quiz_manager.start_quiz(user_id, level)
-            line_bot_api.reply_message(event.reply_token, reply_msgs)
+            reply(event, reply_msgs)
             return
 
         elif text == "☺︎ 詢問AI":
-            user_states[user_id] = "ai_mode"
+            set_state(user_id, "ai_mode")
             reply_msgs = ai_manager.get_ai_mode_flex()
-            line_bot_api.reply_message(event.reply_token, reply_msgs)
+            reply(event, reply_msgs)
             return
 
         else:
-            # 主選單或不認識指令，回主選單提示
-            reply_msgs = get_main_menu_template()
-            reply_msgs.append(TextSendMessage(text="請從下方選單選擇功能或點擊按鈕開始。"))
-            line_bot_api.reply_message(event.reply_token, reply_msgs)
+            # 不認識的指令只回短訊息加快速回覆，不再重送整個主選單 carousel
+            reply_msgs = attach_quick_reply(
+                [TextSendMessage(text="請從下方選單選擇功能或點擊按鈕開始。")],
+                *MAIN_MENU_QUICK_REPLY
+            )
+            reply(event, reply_msgs)
             return
 
     # 外幣換算模式
@@ -256,8 +462,8 @@ def handle_message(event: MessageEvent):
         reply_msgs = forex_manager.process_forex(user_id, text)
         # 完成後返回主選單
         if forex_manager.is_done(user_id):
-            user_states[user_id] = "main_menu"
-        line_bot_api.reply_message(event.reply_token, reply_msgs)
+            set_state(user_id, "main_menu")
+        reply(event, reply_msgs)
         return
 
     # 金融小學堂 quiz 模式
@@ -267,31 +473,63 @@ def handle_message(event: MessageEvent):
         if hasattr(quiz_manager, "last_upgrade_level") and user_id in quiz_manager.last_upgrade_level:
             new_level = quiz_manager.last_upgrade_level[user_id]
             member_data_store[user_id]["member_level"] = new_level
-            save_members()
+            mark_members_dirty()
             del quiz_manager.last_upgrade_level[user_id]
 
+        # 作答結果累加到會員 quiz_record
+        graded = quiz_manager.last_graded.pop(user_id, None)
+        if graded:
+            update_quiz_record(user_id, graded)
+
         # 繼續或結束 quiz
         if quiz_manager.is_done(user_id):
-            user_states[user_id] = "main_menu"
+            set_state(user_id, "main_menu")
 
-        line_bot_api.reply_message(event.reply_token, reply_msgs)
+        reply(event, reply_msgs)
         return
 
     # AI 問答模式
     elif state == "ai_mode":
         if text == "結束提問":
-            user_states[user_id] = "main_menu"
+            ai_manager.end_session(user_id)
+            set_state(user_id, "main_menu")
             reply_msgs = get_main_menu_template()
             reply_msgs.append(TextSendMessage(text="已離開AI客服，回到主選單"))
-            line_bot_api.reply_message(event.reply_token, reply_msgs)
+            reply(event, reply_msgs)
             return
         else:
-            reply_msgs = ai_manager.ask(user_id, text)
-            line_bot_api.reply_message(event.reply_token, reply_msgs)
+            reply_msgs = attach_quick_reply(ai_manager.ask(user_id, text), ("結束提問", "結束提問"))
+            reply(event, reply_msgs)
             return
 
     # 預設回主選單，避免狀態異常
-    user_states[user_id] = "main_menu"
+    set_state(user_id, "main_menu")
     reply_msgs = get_main_menu_template()
     reply_msgs.append(TextSendMessage(text="發生異常，已回到主選單，請重新操作"))
-    line_bot_api.reply_message(event.reply_token, reply_msgs)
+    reply(event, reply_msgs)
+
+
+def handle_postback(event: LineEvent):
+    """rich menu 以 richmenuswitch 切換時送來的 postback，只同步狀態、不回覆"""
+    user_id = event_user_key(event)
+    data = event.postback_data or ""
+    if not data.startswith("mode="):
+        return
+    mode = data.split("=", 1)[1]
+    metrics.incr("events.navigation")
+    metrics.incr("events.navigation.richmenu_switch")
+    metrics.incr("events.richmenu_on.navigation")
+    event.channel.rich_menus.switched(event.source.user_id, mode)
+
+    if mode == "main_menu":
+        forex_manager.user_states.pop(user_id, None)
+        quiz_manager.user_progress.pop(user_id, None)
+        ai_manager.end_session(user_id)
+    user_states[user_id] = mode
+
+
+EVENT_HANDLERS = {
+    "message": logged(handle_message),
+    "follow": logged(handle_follow),
+    "postback": logged(handle_postback),
+}
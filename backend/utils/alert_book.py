@@ -0,0 +1,194 @@
+import os
+import json
+import threading
+from bisect import bisect_left, bisect_right
+
+ABOVE = "above"  # 1 台幣 >= 門檻時通知
+BELOW = "below"  # 1 台幣 <= 門檻時通知
+
+
+class AlertBook:
+    """到價提醒索引：每個幣種、每個方向各一組排序好的門檻
+
+    排序方式讓「已觸發」的提醒永遠位於尾端，匯率更新時用 bisect 找到切點，
+    整段取出後直接刪除尾端，成本為 O(log n + k)，k 為觸發的提醒數。
+    訂閱在請求執行緒、比對在排程器執行緒，keys / entries 兩個串列必須一起修改，所有存取都要持有 lock。
+    """
+
+    def __init__(self, filepath=None):
+        self.filepath = filepath
+        self.books = {}  # code -> {direction: (keys, entries)}
+        self.by_user = {}  # user_id -> {(code, direction): threshold}
+        self.lock = threading.RLock()  # subscribe 會呼叫 unsubscribe、match_all 會呼叫 match
+
+    @staticmethod
+    def _key(direction, threshold):
+        # above 以負值遞增排序，門檻越低越靠尾端；below 以門檻遞增排序，門檻越高越靠尾端
+        return -threshold if direction == ABOVE else threshold
+
+    def _book(self, code, direction):
+        return self.books.setdefault(code, {}).setdefault(direction, ([], []))
+
+    def subscribe(self, user_id, code, threshold, direction):
+        """同一用戶同幣種同方向只保留一筆，重複設定視為更新門檻"""
+        with self.lock:
+            self.unsubscribe(user_id, code, direction)
+            keys, entries = self._book(code, direction)
+            key = self._key(direction, threshold)
+            i = bisect_right(keys, key)
+            keys.insert(i, key)
+            entries.insert(i, user_id)
+            self.by_user.setdefault(user_id, {})[(code, direction)] = threshold
+
+    def unsubscribe(self, user_id, code, direction):
+        with self.lock:
+            return self._unsubscribe(user_id, code, direction)
+
+    def _unsubscribe(self, user_id, code, direction):
+        subs = self.by_user.get(user_id)
+        if not subs or (code, direction) not in subs:
+            return False
+        threshold = subs.pop((code, direction))
+        if not subs:
+            del self.by_user[user_id]
+        keys, entries = self._book(code, direction)
+        key = self._key(direction, threshold)
+        i = bisect_left(keys, key)
+        while i < len(keys) and keys[i] == key:
+            if entries[i] == user_id:
+                del keys[i]
+                del entries[i]
+                break
+            i += 1
+        return True
+
+    def user_alerts(self, user_id):
+        with self.lock:
+            return [
+                (code, direction, threshold)
+                for (code, direction), threshold in self.by_user.get(user_id, {}).items()
+            ]
+
+    def match(self, code, rate):
+        """取出並移除此匯率觸發的提醒，回傳 [(user_id, code, direction, threshold), ...]"""
+        with self.lock:
+            return self._match(code, rate)
+
+    def _match(self, code, rate):
+        triggered = []
+        book = self.books.get(code)
+        if not book or rate is None:
+            return triggered
+        for direction, (keys, entries) in book.items():
+            i = bisect_left(keys, self._key(direction, rate))
+            if i == len(keys):
+                continue
+            for key, user_id in zip(keys[i:], entries[i:]):
+                threshold = -key if direction == ABOVE else key
+                triggered.append((user_id, code, direction, threshold))
+                subs = self.by_user.get(user_id)
+                if subs is not None:
+                    subs.pop((code, direction), None)
+                    if not subs:
+                        del self.by_user[user_id]
+            del keys[i:]
+            del entries[i:]
+        return triggered
+
+    def match_all(self, rates):
+        """依用戶彙整這次更新觸發的所有提醒，讓每位用戶只收到一則推播"""
+        by_user = {}
+        with self.lock:
+            for code in self.books:
+                for alert in self._match(code, rates.get(code)):
+                    by_user.setdefault(alert[0], []).append(alert[1:])
+        return by_user
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(keys) for book in self.books.values() for keys, _ in book.values())
+
+    def load(self):
+        if not self.filepath or not os.path.isfile(self.filepath):
+            return
+        try:
+            with open(self.filepath, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+        except Exception as e:
+            print(f"[AlertBook] 載入到價提醒失敗：{e}")
+            return
+        self.bulk_load(rows)
+        print(f"[AlertBook] 載入到價提醒 {len(self)} 筆")
+
+    def bulk_load(self, rows):
+        """一次排序建立索引，比逐筆 subscribe 的插入快得多；rows 為 [user_id, code, direction, threshold]"""
+        by_user = {}
+        for user_id, code, direction, threshold in rows:
+            by_user.setdefault(user_id, {})[(code, direction)] = threshold
+        grouped = {}
+        for user_id, subs in by_user.items():
+            for (code, direction), threshold in subs.items():
+                grouped.setdefault((code, direction), []).append((self._key(direction, threshold), user_id))
+        books = {}
+        for (code, direction), pairs in grouped.items():
+            pairs.sort()
+            books.setdefault(code, {})[direction] = ([k for k, _ in pairs], [u for _, u in pairs])
+        with self.lock:
+            self.books = books
+            self.by_user = by_user
+
+    def save(self):
+        if not self.filepath:
+            return
+        # 寫檔也在 lock 內，避免兩個執行緒同時寫同一個暫存檔
+        with self.lock:
+            rows = [
+                [user_id, code, direction, threshold]
+                for user_id, subs in self.by_user.items()
+                for (code, direction), threshold in subs.items()
+            ]
+            try:
+                tmp_path = self.filepath + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(rows, f, ensure_ascii=False, separators=(",", ":"))
+                os.replace(tmp_path, self.filepath)
+            except Exception as e:
+                print(f"[AlertBook] 儲存到價提醒失敗：{e}")
+
+
+if __name__ == "__main__":
+    # 基準測試：python -m backend.utils.alert_book [訂閱數]
+    import sys
+    import time
+    import random
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    base_rates = {"USD": 0.031, "JPY": 4.8, "EUR": 0.029, "CNY": 0.22, "KRW": 42.0,
+                  "HKD": 0.24, "GBP": 0.025, "AUD": 0.048, "SGD": 0.041, "THB": 1.12}
+    codes = list(base_rates)
+    rows = []
+    for i in range(count):
+        code = random.choice(codes)
+        rate = base_rates[code]
+        if i % 2:
+            rows.append([f"U{i}", code, ABOVE, rate * random.uniform(1.0, 1.2)])
+        else:
+            rows.append([f"U{i}", code, BELOW, rate * random.uniform(0.8, 1.0)])
+
+    book = AlertBook()
+    start = time.perf_counter()
+    book.bulk_load(rows)
+    print(f"建立索引：{count} 筆，{(time.perf_counter() - start) * 1000:.0f} ms")
+
+    # 匯率逐步上漲，每次更新只觸發一小部分提醒
+    for step in range(1, 6):
+        rates = {code: rate * (1 + 0.002 * step) for code, rate in base_rates.items()}
+        start = time.perf_counter()
+        triggered = book.match_all(rates)
+        elapsed = (time.perf_counter() - start) * 1000
+        fired = sum(len(v) for v in triggered.values())
+        print(f"更新 {step}：觸發 {fired} 筆（{len(triggered)} 位用戶），比對 {elapsed:.2f} ms，剩餘 {len(book)} 筆")
+
+    start = time.perf_counter()
+    triggered = book.match_all(rates)
+    print(f"無觸發的更新：{(time.perf_counter() - start) * 1000:.3f} ms")
@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+CHART_DIR = os.path.join(os.path.dirname(__file__), "..", "static", "charts")
+INDEX_FILENAME = "index.json"
+
+
+def chart_digest(currency, points):
+    """依幣種與資料點算出內容雜湊，相同資料永遠對應同一個檔名"""
+    h = hashlib.sha1(currency.encode("utf-8"))
+    for ts, rate in points:
+        h.update(f"{int(ts)}:{rate:.6f};".encode("ascii"))
+    return h.hexdigest()[:16]
+
+
+def render_chart(currency, points, out_dir, with_webp=True):
+    """在子行程中繪製走勢圖，回傳 (png 檔名, webp 檔名或 None, 耗時秒數)"""
+    start = time.perf_counter()
+    digest = chart_digest(currency, points)
+    png_name = f"{currency}_{digest}.png"
+    webp_name = f"{currency}_{digest}.webp"
+    png_path = os.path.join(out_dir, png_name)
+    webp_path = os.path.join(out_dir, webp_name)
+
+    # 內容定址：檔案已存在就不必再畫
+    if os.path.exists(png_path):
+        webp = webp_name if os.path.exists(webp_path) else None
+        return png_name, webp, time.perf_counter() - start
+
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    xs = [time.strftime("%m/%d", time.localtime(ts)) for ts, _ in points]
+    ys = [rate for _, rate in points]
+
+    # LINE carousel 縮圖為正方形
+    fig, ax = plt.subplots(figsize=(4, 4), dpi=100)
+    ax.plot(xs, ys, color="#1DB446", linewidth=2, marker="o", markersize=3)
+    ax.set_title(f"TWD -> {currency}")
+    ax.grid(True, alpha=0.3)
+    step = max(1, len(xs) // 5)
+    ax.set_xticks(range(0, len(xs), step))
+    ax.set_xticklabels(xs[::step], fontsize=8)
+    fig.tight_layout()
+
+    os.makedirs(out_dir, exist_ok=True)
+    # 先寫暫存檔再改名，避免 /static/ 讀到寫一半的圖
+    tmp_path = png_path + ".tmp"
+    fig.savefig(tmp_path, format="png")
+    os.replace(tmp_path, png_path)
+
+    webp = None
+    if with_webp:
+        try:
+            fig.savefig(webp_path + ".tmp", format="webp")
+            os.replace(webp_path + ".tmp", webp_path)
+            webp = webp_name
+        except Exception:
+            # 沒有 Pillow 的 webp 支援時只輸出 png
+            webp = None
+    plt.close(fig)
+    return png_name, webp, time.perf_counter() - start
+
+
+class ChartManager:
+    def __init__(self, chart_dir=CHART_DIR, max_points=30, max_age=7 * 24 * 60 * 60, max_workers=1):
+        self.chart_dir = chart_dir
+        self.max_points = max_points  # 每個幣種保留的歷史資料點數
+        self.max_age = max_age  # 超過此秒數未更新的圖會被淘汰
+        self.max_workers = max_workers
+        self.executor = None  # 第一次更新時才建立行程池
+        self.history = {}  # currency -> [(ts, rate), ...]
+        self.index = {}  # currency -> {"png", "webp", "digest", "created", "render_ms"}
+        self.pending = {}  # currency -> digest，避免同一份資料重複送出
+        # 記錄匯率（排程執行緒）與繪圖完成的回呼（行程池的回呼執行緒）都會改索引與歷史，一律持鎖
+        self.lock = threading.Lock()
+        self.load_index()
+
+    def index_path(self):
+        return os.path.join(self.chart_dir, INDEX_FILENAME)
+
+    def load_index(self):
+        path = self.index_path()
+        if not os.path.isfile(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.index = data.get("charts", {})
+            self.history = {k: [tuple(p) for p in v] for k, v in data.get("history", {}).items()}
+        except Exception as e:
+            print(f"[ChartManager] 載入圖表索引失敗：{e}")
+
+    def save_index(self):
+        try:
+            with self.lock:
+                os.makedirs(self.chart_dir, exist_ok=True)
+                tmp_path = self.index_path() + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"charts": self.index, "history": self.history}, f, ensure_ascii=False)
+                os.replace(tmp_path, self.index_path())
+        except Exception as e:
+            print(f"[ChartManager] 儲存圖表索引失敗：{e}")
+
+    def record_rates(self, rates, ts=None):
+        """把這次更新的匯率加入歷史並立即存檔，rates 為 {ISO 代碼: 匯率}
+
+        第一個點還畫不出圖，若只在繪圖完成時存檔，兩次更新之間重啟就會遺失。
+        """
+        ts = ts or time.time()
+        with self.lock:
+            for currency, rate in rates.items():
+                if rate is None:
+                    continue
+                points = self.history.setdefault(currency, [])
+                points.append((ts, float(rate)))
+                if len(points) > self.max_points:
+                    del points[:-self.max_points]
+        self.save_index()
+
+    def refresh(self, rates, ts=None):
+        """匯率更新後呼叫：記錄歷史並在背景行程池重繪走勢圖，不會阻塞請求"""
+        self.record_rates(rates, ts)
+        if self.executor is None:
+            # 此時行程內已有其他執行緒，fork 可能複製到被鎖住的鎖，子行程改用 spawn 啟動
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                mp_context=multiprocessing.get_context("spawn"))
+
+        for currency in rates:
+            with self.lock:
+                points = list(self.history.get(currency, ()))
+                if len(points) < 2:
+                    continue  # 至少兩個點才畫得出走勢
+                digest = chart_digest(currency, points)
+                current = self.index.get(currency, {})
+                if current.get("digest") == digest or self.pending.get(currency) == digest:
+                    continue
+                self.pending[currency] = digest
+            future = self.executor.submit(render_chart, currency, points, self.chart_dir)
+            future.add_done_callback(lambda f, c=currency, d=digest: self._on_rendered(c, d, f))
+
+    def _on_rendered(self, currency, digest, future):
+        try:
+            png_name, webp_name, elapsed = future.result()
+        except Exception as e:
+            with self.lock:
+                self._clear_pending(currency, digest)
+            print(f"[ChartManager] 繪製 {currency} 走勢圖失敗：{e}")
+            return
+
+        with self.lock:
+            # 與寫入索引同時移出 pending，清理殘留檔案時才不會誤刪剛畫好的圖
+            self._clear_pending(currency, digest)
+            old = self.index.get(currency)
+            self.index[currency] = {
+                "png": png_name,
+                "webp": webp_name,
+                "digest": digest,
+                "created": time.time(),
+                "render_ms": round(elapsed * 1000, 1),
+            }
+        # 同幣種的舊圖已被新圖取代，直接刪除
+        if old and old.get("png") != png_name:
+            self._remove_files(old)
+        self.evict_stale()
+        self.save_index()
+
+    def _clear_pending(self, currency, digest):
+        if self.pending.get(currency) == digest:
+            del self.pending[currency]
+
+    def _remove_files(self, entry):
+        for key in ("png", "webp"):
+            name = entry.get(key)
+            if not name:
+                continue
+            try:
+                os.remove(os.path.join(self.chart_dir, name))
+            except FileNotFoundError:
+                pass
+
+    def evict_stale(self, now=None):
+        """淘汰過久未更新的幣種圖表，以及索引外殘留的檔案"""
+        now = now or time.time()
+        with self.lock:
+            for currency in list(self.index):
+                entry = self.index[currency]
+                if now - entry.get("created", 0) > self.max_age:
+                    self._remove_files(entry)
+                    del self.index[currency]
+            live = set()
+            for entry in self.index.values():
+                live.add(entry.get("png"))
+                live.add(entry.get("webp"))
+            # 子行程已寫好、回呼還沒寫進索引的圖
+            for currency, digest in self.pending.items():
+                live.add(f"{currency}_{digest}.png")
+                live.add(f"{currency}_{digest}.webp")
+
+        if not os.path.isdir(self.chart_dir):
+            return
+        for name in os.listdir(self.chart_dir):
+            if name == INDEX_FILENAME or name.endswith(".tmp") or name in live:
+                continue
+            try:
+                os.remove(os.path.join(self.chart_dir, name))
+            except OSError:
+                pass
+
+    def get_chart_url(self, currency, base_url):
+        """回傳已繪製好的走勢圖網址；尚未產生時回傳 None，請求端絕不會觸發繪圖"""
+        entry = self.index.get(currency)
+        if not entry:
+            return None
+        return base_url + "charts/" + entry["png"]
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+
+if __name__ == "__main__":
+    # 基準測試：python -m backend.utils.chart_utils [張數]
+    import sys
+    import random
+    import tempfile
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    now = time.time()
+    with tempfile.TemporaryDirectory() as tmp:
+        timings = []
+        for i in range(count):
+            points = [(now - (30 - d) * 86400, 30 + random.random()) for d in range(30)]
+            _, _, elapsed = render_chart(f"C{i:03d}", points, tmp)
+            timings.append(elapsed * 1000)
+        timings.sort()
+        print(f"繪製 {count} 張走勢圖")
+        print(f"平均 {sum(timings) / count:.1f} ms/張，中位數 {timings[count // 2]:.1f} ms，最慢 {timings[-1]:.1f} ms")
@@ -0,0 +1,91 @@
+import time
+import threading
+from collections import deque
+
+
+def estimate_tokens(text):
+    """粗估 token 數：中日韓文字約一字一個 token，英數約四個字元一個 token"""
+    wide = 0
+    narrow = 0
+    for ch in text:
+        if ord(ch) >= 0x2E80:
+            wide += 1
+        else:
+            narrow += 1
+    return wide + (narrow + 3) // 4
+
+
+class Session:
+    __slots__ = ("turns", "digest", "last_seen")
+
+    def __init__(self, max_turns):
+        self.turns = deque(maxlen=max_turns)  # [(問題, 回答)]
+        self.digest = deque()  # 已被擠出的舊對話，只保留問題重點
+        self.last_seen = time.time()
+
+
+class ConversationMemory:
+    """每位用戶固定大小的對話記憶，prompt 長度不會隨聊天變長而成長"""
+
+    def __init__(self, max_turns=4, token_budget=1200, digest_budget=150,
+                 max_answer_chars=200, idle_ttl=30 * 60):
+        self.max_turns = max_turns
+        self.token_budget = token_budget  # 整個 prompt 的上限
+        self.digest_budget = digest_budget  # 摘要的上限
+        self.max_answer_chars = max_answer_chars  # 記憶中每則回答最多保留的字數
+        self.idle_ttl = idle_ttl
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def _session(self, user_id):
+        session = self.sessions.get(user_id)
+        if session is None:
+            session = self.sessions[user_id] = Session(self.max_turns)
+        session.last_seen = time.time()
+        return session
+
+    def _fold(self, session, turn):
+        """把舊的一輪對話摺進摘要，只留問題，摘要超出上限就丟掉最舊的"""
+        question = turn[0]
+        session.digest.append(question[:40])
+        while len(session.digest) > 1 and estimate_tokens("；".join(session.digest)) > self.digest_budget:
+            session.digest.popleft()
+
+    def add_turn(self, user_id, question, answer):
+        with self.lock:
+            session = self._session(user_id)
+            if len(session.turns) == session.turns.maxlen:
+                self._fold(session, session.turns[0])
+            session.turns.append((question, answer[:self.max_answer_chars]))
+
+    def build_prompt(self, user_id, question, instruction):
+        """組出送給模型的內容；超過 token 預算時把最舊的對話摺進摘要"""
+        with self.lock:
+            session = self._session(user_id)
+            while True:
+                parts = []
+                if session.digest:
+                    parts.append("先前提過的問題：" + "；".join(session.digest))
+                if session.turns:
+                    history = "\n".join(f"使用者：{q}\n小金：{a}" for q, a in session.turns)
+                    parts.append("最近的對話：\n" + history)
+                parts.append(question)
+                parts.append(instruction)
+                if not session.turns or estimate_tokens("".join(parts)) <= self.token_budget:
+                    return parts
+                self._fold(session, session.turns.popleft())
+
+    def end_session(self, user_id):
+        with self.lock:
+            self.sessions.pop(user_id, None)
+
+    def sweep(self, now=None):
+        """清掉閒置過久的對話，回傳清除數量；由排程器定時呼叫"""
+        now = now or time.time()
+        with self.lock:
+            idle = [uid for uid, s in self.sessions.items() if now - s.last_seen > self.idle_ttl]
+            for uid in idle:
+                del self.sessions[uid]
+        if idle:
+            print(f"[ConversationMemory] 清除閒置對話 {len(idle)} 筆")
+        return len(idle)
@@ -0,0 +1,145 @@
+import re
+import unicodedata
+
+# 常用幣種的中文名稱與別名，第一個名稱作為顯示名稱
+CURRENCY_NAMES = {
+    "USD": ["美元", "美金", "美幣", "US$", "＄"],
+    "JPY": ["日圓", "日幣", "日元", "日円", "円", "¥", "￥"],
+    "EUR": ["歐元", "€"],
+    "CNY": ["人民幣", "人民币", "RMB", "CN¥"],
+    "KRW": ["韓元", "韓幣", "韩元", "₩"],
+    "HKD": ["港幣", "港元", "港币", "HK$"],
+    "GBP": ["英鎊", "英镑", "£"],
+    "AUD": ["澳幣", "澳元", "澳洲幣", "A$"],
+    "SGD": ["新加坡幣", "新幣", "新元", "S$"],
+    "THB": ["泰銖", "泰幣", "泰铢", "฿"],
+    "CAD": ["加幣", "加元", "加拿大幣", "C$"],
+    "CHF": ["瑞士法郎", "瑞郎"],
+    "NZD": ["紐幣", "紐元", "紐西蘭幣", "NZ$"],
+    "VND": ["越南盾", "越盾", "₫"],
+    "MYR": ["馬幣", "令吉", "馬來西亞幣", "RM"],
+    "PHP": ["菲律賓披索", "菲幣", "₱"],
+    "IDR": ["印尼盾", "印尼幣", "Rp"],
+    "INR": ["印度盧比", "盧比", "₹"],
+    "MOP": ["澳門幣", "澳門元"],
+    "SEK": ["瑞典克朗"],
+    "NOK": ["挪威克朗"],
+    "DKK": ["丹麥克朗"],
+    "ZAR": ["南非幣", "南非蘭特"],
+    "MXN": ["墨西哥披索"],
+    "BRL": ["巴西里拉", "巴西雷亞爾"],
+    "TRY": ["土耳其里拉"],
+    "RUB": ["俄羅斯盧布", "盧布", "₽"],
+    "AED": ["阿聯迪拉姆", "迪拉姆"],
+    "SAR": ["沙烏地里亞爾"],
+    "ILS": ["以色列新謝克爾", "謝克爾", "₪"],
+    "PLN": ["波蘭茲羅提"],
+    "CZK": ["捷克克朗"],
+    "HUF": ["匈牙利福林"],
+}
+
+# 本位幣（台幣）的寫法，用來判斷輸入的金額是台幣還是外幣
+BASE_CURRENCY_NAMES = ["twd", "ntd", "nt$", "台幣", "臺幣"]
+
+# carousel 依此順序分頁顯示，其餘幣種照代碼排序接在後面
+POPULAR_CURRENCIES = [
+    "USD", "JPY", "EUR", "CNY", "KRW", "HKD", "GBP", "AUD", "SGD", "THB",
+    "CAD", "CHF", "NZD", "VND", "MYR", "PHP", "IDR", "INR", "MOP",
+]
+
+_END = ""  # trie 節點的結尾標記，不會與任何字元衝突
+# 帶上負號，讓「-100」、「日幣-50」被當成負數擋下，而不是默默當成正數換算
+_AMOUNT_RE = re.compile(r"[-−]?(?:\d+(?:,\d{3})*(?:\.\d+)?|\.\d+)")
+
+
+def normalize(text):
+    # 全形轉半形並轉小寫，讓「ＵＳＤ」、「usd」都能比對
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+class CurrencyRegistry:
+    def __init__(self, base_currency="TWD"):
+        self.base_currency = base_currency
+        self.codes = []  # 依顯示順序排列的 ISO 代碼
+        self.code_set = set()
+        self.trie = {}
+        self.max_alias_len = 0
+
+    def build(self, codes):
+        """匯率更新時重建索引，codes 為 API 回傳的所有 ISO 代碼"""
+        codes = {c.upper() for c in codes if c and c.upper() != self.base_currency}
+        popular = [c for c in POPULAR_CURRENCIES if c in codes]
+        others = sorted(codes - set(popular))
+
+        trie = {}
+        max_len = 0
+        for code in popular + others:
+            for alias in [code] + CURRENCY_NAMES.get(code, []):
+                key = normalize(alias)
+                node = trie
+                for ch in key:
+                    node = node.setdefault(ch, {})
+                # 純英文字母的別名需以非英文字母為邊界，避免誤判單字中的片段
+                node[_END] = (code, key.isascii() and key.isalpha())
+                max_len = max(max_len, len(key))
+
+        # 建好後才一次替換，請求端不會看到半成品
+        self.trie = trie
+        self.max_alias_len = max_len
+        self.codes = popular + others
+        self.code_set = set(self.codes)
+
+    def __contains__(self, code):
+        return code in self.code_set
+
+    def display_name(self, code):
+        names = CURRENCY_NAMES.get(code)
+        return names[0] if names else code
+
+    def find_currency(self, text):
+        """從任意文字中找出幣種，最長別名優先；每個位置最多走 max_alias_len 步，整體為 O(輸入長度)"""
+        text = normalize(text)
+        n = len(text)
+        i = 0
+        while i < n:
+            node = self.trie
+            j = i
+            match = None
+            while j < n and text[j] in node:
+                node = node[text[j]]
+                j += 1
+                if _END in node:
+                    code, needs_boundary = node[_END]
+                    if not needs_boundary or self._at_boundary(text, i, j):
+                        match = (code, j)
+            if match:
+                return match[0]
+            i += 1
+        return None
+
+    @staticmethod
+    def _at_boundary(text, start, end):
+        before = text[start - 1] if start > 0 else " "
+        after = text[end] if end < len(text) else " "
+        return not (before.isascii() and before.isalpha()) and not (after.isascii() and after.isalpha())
+
+    def parse(self, text):
+        """解析「100美金」、「usd 50」這類輸入，回傳 (幣種代碼或 None, 金額或 None)"""
+        code = self.find_currency(text)
+        amount = None
+        m = _AMOUNT_RE.search(normalize(text))
+        if m:
+            amount = float(m.group().replace(",", "").replace("−", "-"))
+        return code, amount
+
+    def mentions_base(self, text):
+        """輸入中是否寫了台幣，例如「100台幣換美金」"""
+        text = normalize(text)
+        return any(name in text for name in BASE_CURRENCY_NAMES)
+
+    def page(self, page_no, page_size):
+        start = page_no * page_size
+        return self.codes[start:start + page_size]
+
+    def page_count(self, page_size):
+        return max(1, (len(self.codes) + page_size - 1) // page_size)
@@ -0,0 +1,125 @@
+import os
+import json
+import math
+import unicodedata
+
+FAQ_PATH = os.path.join(os.path.dirname(__file__), "..", "members", "faq.json")
+
+
+def tokenize(text, n=2):
+    """字元 n-gram：去掉標點與空白後切成連續 n 個字，中文不需斷詞"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    chars = [ch for ch in text if ch.isalnum()]
+    if len(chars) < n:
+        return ["".join(chars)] if chars else []
+    return ["".join(chars[i:i + n]) for i in range(len(chars) - n + 1)]
+
+
+class FaqIndex:
+    """以 BM25 檢索題庫與常見問答，高信心命中時直接回答，不必呼叫 Gemini"""
+
+    def __init__(self, k1=1.5, b=0.75, n=2):
+        self.k1 = k1
+        self.b = b
+        self.n = n
+        self.docs = []  # [(question, answer)]
+        self.postings = {}  # term -> [(doc_id, tf)]
+        self.idf = {}
+        self.doc_lens = []
+        self.self_scores = []  # 每份文件以自己的問題查詢時的分數，用來把分數正規化成 0~1
+        self.avg_len = 0.0
+
+    def add(self, question, answer):
+        self.docs.append((question, answer))
+
+    def build(self):
+        tfs = []
+        for question, answer in self.docs:
+            tf = {}
+            for term in tokenize(question + " " + answer, self.n):
+                tf[term] = tf.get(term, 0) + 1
+            tfs.append(tf)
+        self.doc_lens = [sum(tf.values()) for tf in tfs]
+        self.avg_len = sum(self.doc_lens) / len(self.doc_lens) if self.doc_lens else 0.0
+
+        postings = {}
+        for doc_id, tf in enumerate(tfs):
+            for term, count in tf.items():
+                postings.setdefault(term, []).append((doc_id, count))
+        total = len(self.docs)
+        self.postings = postings
+        self.idf = {
+            term: math.log(1 + (total - len(p) + 0.5) / (len(p) + 0.5))
+            for term, p in postings.items()
+        }
+        self.self_scores = [
+            self.score_all(tokenize(question, self.n)).get(doc_id, 0.0)
+            for doc_id, (question, _) in enumerate(self.docs)
+        ]
+        print(f"[FaqIndex] 建立檢索索引：{total} 筆問答，{len(postings)} 個詞")
+        return self
+
+    def score_all(self, terms):
+        scores = {}
+        k1, b, avg_len = self.k1, self.b, self.avg_len or 1.0
+        for term in set(terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self.idf[term]
+            for doc_id, tf in postings:
+                norm = k1 * (1 - b + b * self.doc_lens[doc_id] / avg_len)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query):
+        """回傳 (問題, 答案, 信心值 0~1)，沒有任何相符時回傳 None"""
+        scores = self.score_all(tokenize(query, self.n))
+        if not scores:
+            return None
+        doc_id = max(scores, key=scores.get)
+        confidence = min(1.0, scores[doc_id] / self.self_scores[doc_id]) if self.self_scores[doc_id] else 0.0
+        question, answer = self.docs[doc_id]
+        return question, answer, confidence
+
+    @classmethod
+    def from_sources(cls, questions_data, faq_path=FAQ_PATH):
+        """題庫的題目/正解，加上選填的常見問答檔 [{"question", "answer"}]"""
+        index = cls()
+        for questions in questions_data.values():
+            for q in questions:
+                if q.get("question") and q.get("answer"):
+                    index.add(q["question"], q["answer"])
+        if os.path.isfile(faq_path):
+            try:
+                with open(faq_path, "r", encoding="utf-8") as f:
+                    for item in json.load(f):
+                        index.add(item["question"], item["answer"])
+            except Exception as e:
+                print(f"[FaqIndex] 載入常見問答檔失敗：{e}")
+        return index.build()
+
+
+if __name__ == "__main__":
+    # 檢索延遲與命中率：python -m backend.utils.faq_index
+    import time
+
+    quiz_path = os.path.join(os.path.dirname(__file__), "..", "members", "quiz_questions.json")
+    with open(quiz_path, encoding="utf-8") as f:
+        index = FaqIndex.from_sources(json.load(f))
+
+    threshold = 0.8
+    queries = [q for q, _ in index.docs]
+    queries += [q.rstrip("？?") + "呢" for q, _ in index.docs]  # 口語化改寫
+    queries += ["比特幣值得投資嗎", "今天天氣如何", "如何申請房貸", "ETF 和基金差在哪裡"]  # 題庫外的問題
+    latencies = []
+    hits = 0
+    for query in queries:
+        start = time.perf_counter()
+        result = index.search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        if result and result[2] >= threshold:
+            hits += 1
+    latencies.sort()
+    print(f"查詢 {len(queries)} 次，命中 {hits} 次（{hits / len(queries):.0%}，門檻 {threshold}）")
+    print(f"延遲 中位數 {latencies[len(latencies) // 2]:.3f} ms，p99 {latencies[int(len(latencies) * 0.99)]:.3f} ms")
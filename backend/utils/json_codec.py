@@ -0,0 +1,209 @@
+import hmac
+import base64
+import hashlib
+import json
+
+import requests
+
+# 依序嘗試較快的 JSON 套件，都沒有安裝時使用標準函式庫
+try:
+    import orjson
+
+    BACKEND = "orjson"
+
+    def loads(data):
+        return orjson.loads(data)
+
+    def dumps(obj):
+        return orjson.dumps(obj)
+except ImportError:
+    try:
+        import msgspec
+
+        BACKEND = "msgspec"
+        _encoder = msgspec.json.Encoder()
+        _decoder = msgspec.json.Decoder()
+
+        def loads(data):
+            return _decoder.decode(data)
+
+        def dumps(obj):
+            return _encoder.encode(obj)
+    except ImportError:
+        BACKEND = "json"
+
+        def loads(data):
+            return json.loads(data)
+
+        def dumps(obj):
+            return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def verify_signature(channel_secret, body, signature):
+    """直接對原始位元組驗證 X-Line-Signature，不需先解碼成字串"""
+    if not signature:
+        return False
+    digest = hmac.new(channel_secret.encode("utf-8"), body, hashlib.sha256).digest()
+    return hmac.compare_digest(base64.b64encode(digest), signature.encode("utf-8"))
+
+
+class Source:
+    __slots__ = ("type", "user_id", "group_id", "room_id")
+
+    def __init__(self, data):
+        self.type = data.get("type")
+        self.user_id = data.get("userId")
+        self.group_id = data.get("groupId")
+        self.room_id = data.get("roomId")
+
+
+class LineEvent:
+    """webhook 事件只保留機器人用得到的欄位，取代 SDK 的事件物件"""
+
+    __slots__ = ("type", "timestamp", "reply_token", "source", "message_type", "text",
+                 "postback_data", "webhook_event_id", "channel")
+
+    def __init__(self, data):
+        self.type = data.get("type")
+        self.timestamp = data.get("timestamp")
+        self.reply_token = data.get("replyToken")
+        self.source = Source(data.get("source") or {})
+        message = data.get("message") or {}
+        self.message_type = message.get("type")
+        self.text = message.get("text")
+        self.postback_data = (data.get("postback") or {}).get("data")
+        self.webhook_event_id = data.get("webhookEventId")
+        self.channel = None
+
+
+class InvalidBodyError(ValueError):
+    """簽章正確但內容不是合法的 webhook JSON"""
+
+
+def parse_events(body):
+    """整個請求只解析一次，回傳 (destination, [LineEvent])"""
+    try:
+        data = loads(body)
+    except Exception as e:  # 各 JSON 後端的解析錯誤類別不同
+        raise InvalidBodyError(f"無法解析 webhook 內容：{e}")
+    events = data.get("events") if isinstance(data, dict) else None
+    if not isinstance(events, list):
+        raise InvalidBodyError("webhook 內容缺少 events")
+    return data.get("destination"), [LineEvent(e) for e in events if isinstance(e, dict)]
+
+
+class RawPayload:
+    """已預先序列化的外送訊息，送出時直接拼接位元組"""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def as_json_dict(self):
+        # 交給 SDK（push、multicast）時才還原成 dict
+        return loads(self.data)
+
+
+class PayloadCache:
+    """內容固定的訊息（例如主選單）只序列化一次"""
+
+    def __init__(self):
+        self.items = {}
+
+    def get(self, key, builder):
+        payload = self.items.get(key)
+        if payload is None:
+            payload = self.items[key] = RawPayload(encode_message(builder()))
+        return payload
+
+    def clear(self):
+        self.items.clear()
+
+
+def encode_message(message):
+    if isinstance(message, RawPayload):
+        return message.data
+    return dumps(message.as_json_dict())
+
+
+class ReplyClient:
+    """以預先序列化的位元組呼叫 reply API，省去 SDK 的 as_json_dict + json.dumps"""
+
+    def __init__(self, channel_access_token, endpoint="https://api.line.me", timeout=5):
+        self.url = endpoint + "/v2/bot/message/reply"
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({
+            "Authorization": "Bearer " + channel_access_token,
+            "Content-Type": "application/json",
+        })
+
+    @staticmethod
+    def build_body(reply_token, messages):
+        return (b'{"replyToken":' + dumps(reply_token) + b',"messages":['
+                + b",".join(encode_message(m) for m in messages) + b"]}")
+
+    def reply(self, reply_token, messages):
+        resp = self.session.post(self.url, data=self.build_body(reply_token, messages), timeout=self.timeout)
+        if resp.status_code >= 400:
+            print(f"[ReplyClient] 回覆失敗 {resp.status_code}: {resp.text}")
+            resp.raise_for_status()
+
+
+if __name__ == "__main__":
+    # 每個事件的解析／序列化微基準：python -m backend.utils.json_codec
+    import time
+
+    secret = "benchmark-secret"
+    body = json.dumps({
+        "destination": "Uxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx",
+        "events": [{
+            "type": "message",
+            "mode": "active",
+            "timestamp": 1700000000000,
+            "webhookEventId": "01HBENCHMARK",
+            "deliveryContext": {"isRedelivery": False},
+            "replyToken": "b60d432864f44d079f6d8efe86cf404b",
+            "source": {"type": "user", "userId": "U4af4980629000000000000000000000"},
+            "message": {"id": "325708", "type": "text", "quoteToken": "q", "text": "💱 外幣換算"},
+        }],
+    }, ensure_ascii=False).encode("utf-8")
+    signature = base64.b64encode(hmac.new(secret.encode(), body, hashlib.sha256).digest()).decode()
+    rounds = 20000
+
+    def bench(label, func):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            func()
+        print(f"{label:<28}{(time.perf_counter() - start) / rounds * 1e6:8.1f} µs/事件")
+
+    print(f"JSON 後端：{BACKEND}")
+    bench("解析（新）", lambda: (verify_signature(secret, body, signature), parse_events(body)))
+    try:
+        from linebot import WebhookParser
+        from linebot.models import (
+            TemplateSendMessage, CarouselTemplate, CarouselColumn, MessageAction, TextSendMessage,
+        )
+    except ImportError:
+        print("未安裝 line-bot-sdk，略過與現行 SDK 路徑的比較")
+    else:
+        parser = WebhookParser(secret)
+        bench("解析（SDK 現行）", lambda: parser.parse(body.decode("utf-8"), signature))
+
+        def build_menu():
+            columns = [
+                CarouselColumn(thumbnail_image_url=f"https://example.com/static/image{i}.png", title=f"標題{i}",
+                               text="說明文字", actions=[MessageAction(label="按鈕", text=f"指令{i}")])
+                for i in range(3, 6)
+            ]
+            return TemplateSendMessage(alt_text="歡迎選單",
+                                       template=CarouselTemplate(columns=columns, image_aspect_ratio="rectangle",
+                                                                 image_size="cover"))
+
+        cache = PayloadCache()
+        reply_text = TextSendMessage(text="請從下方選單選擇功能或點擊按鈕開始。")
+        bench("序列化（SDK 現行）", lambda: json.dumps({
+            "replyToken": "t", "messages": [build_menu().as_json_dict(), reply_text.as_json_dict()]}))
+        bench("序列化（快取 + 拼接）", lambda: ReplyClient.build_body(
+            "t", [cache.get("menu", build_menu), reply_text]))
@@ -0,0 +1,390 @@
+"""會員資料格式轉換工具：在 members.json、單一用戶檔、NDJSON、SQLite 之間串流搬移
+
+    python -m backend.utils.member_migrate 來源 目的 [--workers N] [--progress N] [--no-verify]
+
+來源／目的寫成「格式:路徑」，省略格式時依副檔名判斷：
+    json:members.json            與 load_members() 相同的 {user_id: 資料} 單一檔案
+    dir:backend/members/users    每位用戶一個檔案，沿用 member_utils.load_member / save_member
+    ndjson:members.ndjson        每行一筆 {user_id: 資料}
+    sqlite:members.db            members(user_id TEXT PRIMARY KEY, data TEXT)
+    synthetic:1000000            （僅來源）產生假會員資料，用於壓力測試
+
+全程逐筆處理，記憶體用量與會員數無關；搬移完成後重新讀取目的端比對筆數與校驗碼。
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.utils import json_codec
+from backend.utils.member_utils import load_member, save_member
+
+CHUNK_SIZE = 1 << 20
+SQLITE_BATCH = 10000
+WHITESPACE = " \t\r\n"
+
+
+class JsonObjectReader:
+    """增量解析頂層為物件的大型 JSON 檔，一次只保留一個會員的資料"""
+
+    def __init__(self, path, chunk_size=CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+
+    def __iter__(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            self.file = f
+            self.buf = ""
+            self.pos = 0
+            self.eof = False
+            if self._next_char() != "{":
+                raise ValueError(f"{self.path} 不是 JSON 物件")
+            self.pos += 1
+            if self._next_char() == "}":
+                return
+            while True:
+                key = self._decode()
+                if not isinstance(key, str):
+                    raise ValueError(f"{self.path} 的鍵值必須是字串")
+                if self._next_char() != ":":
+                    raise ValueError(f"{self.path} 格式錯誤：缺少冒號")
+                self.pos += 1
+                yield key, self._decode()
+                sep = self._next_char()
+                self.pos += 1
+                if sep == "}":
+                    return
+                if sep != ",":
+                    raise ValueError(f"{self.path} 格式錯誤：預期逗號或右大括號")
+
+    def _fill(self):
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # 只在補資料時丟掉已解析的部分，避免每筆都複製緩衝區
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _next_char(self):
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                raise ValueError(f"{self.path} 內容不完整")
+
+    def _decode(self):
+        self._next_char()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # 數字等純量可能剛好在緩衝區邊界被截斷
+            if end == len(self.buf) and not self.eof and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+class JsonObjectWriter:
+    """逐筆寫出 {user_id: 資料}，完成後才取代目的檔"""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.file = open(self.tmp_path, "wb")
+        self.file.write(b"{")
+        self.first = True
+
+    def write(self, user_id, data):
+        self.file.write((b"" if self.first else b",") + json_codec.dumps(user_id) + b":" + json_codec.dumps(data))
+        self.first = False
+
+    def close(self):
+        self.file.write(b"}")
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.file.close()
+        os.remove(self.tmp_path)
+
+
+def read_ndjson(path):
+    with open(path, "rb") as f:
+        for line in f:
+            if line.strip():
+                (user_id, data), = json_codec.loads(line).items()
+                yield user_id, data
+
+
+class NdjsonWriter(JsonObjectWriter):
+    """每行一筆，可用 head、grep 等工具直接檢視"""
+
+    def __init__(self, path):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.file = open(self.tmp_path, "wb")
+
+    def write(self, user_id, data):
+        self.file.write(b"{" + json_codec.dumps(user_id) + b":" + json_codec.dumps(data) + b"}\n")
+
+    def close(self):
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+
+def read_dir(member_dir):
+    with os.scandir(member_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(".json"):
+                user_id = entry.name[:-5]
+                yield user_id, load_member(user_id, member_dir)
+
+
+class DirWriter:
+    """單一用戶檔以執行緒池平行寫入，限制排隊中的工作數量以維持固定記憶體"""
+
+    def __init__(self, member_dir, workers=8):
+        if os.path.isdir(member_dir) and os.listdir(member_dir):
+            raise ValueError(f"{member_dir} 不是空目錄，請指定新的目錄")
+        os.makedirs(member_dir, exist_ok=True)
+        self.member_dir = member_dir
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="member-writer")
+        self.slots = threading.BoundedSemaphore(workers * 4)
+        self.errors = []
+
+    def write(self, user_id, data):
+        self.slots.acquire()
+        future = self.pool.submit(save_member, user_id, data, self.member_dir)
+        future.add_done_callback(self._done)
+
+    def _done(self, future):
+        self.slots.release()
+        if future.exception():
+            self.errors.append(future.exception())
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        if self.errors:
+            raise self.errors[0]
+
+    def abort(self):
+        # 已寫出的單一用戶檔保留，方便檢查失敗原因
+        self.pool.shutdown(wait=True)
+
+
+def read_sqlite(path):
+    conn = sqlite3.connect(path)
+    try:
+        for user_id, data in conn.execute("SELECT user_id, data FROM members"):
+            yield user_id, json_codec.loads(data)
+    finally:
+        conn.close()
+
+
+class SqliteWriter:
+    """分批 executemany，每批一個交易；完成後才取代目的檔"""
+
+    def __init__(self, path, batch_size=SQLITE_BATCH):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        self.conn = sqlite3.connect(self.tmp_path)
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute("CREATE TABLE members (user_id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        self.batch_size = batch_size
+        self.batch = []
+
+    def write(self, user_id, data):
+        self.batch.append((user_id, json_codec.dumps(data).decode("utf-8")))
+        if len(self.batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO members VALUES (?, ?)", self.batch)
+        self.batch = []
+
+    def close(self):
+        if self.batch:
+            self._flush()
+        self.conn.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.conn.close()
+        os.remove(self.tmp_path)
+
+
+def read_synthetic(count, seed=0):
+    """與 init_member 相同結構的假會員資料"""
+    rng = random.Random(seed)
+    levels = ["一般會員", "初級金融", "高級金融", "菁英金融"]  # 與 QuizManager.levels 相同
+    for i in range(int(count)):
+        user_id = f"U{i:032x}"
+        total = rng.randrange(200)
+        correct = rng.randrange(total + 1)
+        yield user_id, {
+            "user_id": user_id,
+            "name": f"會員{i}",
+            "picture_url": "",
+            "member_level": rng.choice(levels),
+            "quiz_record": {
+                "last_date": f"2024-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}",
+                "correct_count": correct,
+                "total_count": total,
+                "passed_count": rng.randrange(correct // 10 + 1),
+            },
+            "subscribed_currencies": rng.sample(["USD", "JPY", "EUR", "CNY", "HKD"], rng.randrange(3)),
+        }
+
+
+READERS = {
+    "json": lambda path: iter(JsonObjectReader(path)),
+    "dir": read_dir,
+    "ndjson": read_ndjson,
+    "sqlite": read_sqlite,
+    "synthetic": read_synthetic,
+}
+WRITERS = {
+    "json": lambda path, workers: JsonObjectWriter(path),
+    "dir": DirWriter,
+    "ndjson": lambda path, workers: NdjsonWriter(path),
+    "sqlite": lambda path, workers: SqliteWriter(path),
+}
+EXTENSIONS = {".json": "json", ".ndjson": "ndjson", ".jsonl": "ndjson", ".db": "sqlite", ".sqlite": "sqlite"}
+
+
+def parse_spec(spec):
+    """「格式:路徑」-> (格式, 路徑)；未寫格式時依副檔名或是否為目錄判斷"""
+    kind, sep, path = spec.partition(":")
+    if sep and kind in READERS:
+        return kind, path
+    ext = os.path.splitext(spec)[1].lower()
+    if ext in EXTENSIONS:
+        return EXTENSIONS[ext], spec
+    if os.path.isdir(spec) or not ext:
+        return "dir", spec
+    raise ValueError(f"無法判斷 {spec} 的格式，請寫成 格式:路徑")
+
+
+class Checksum:
+    """與順序無關的校驗碼：各筆 sha256(user_id + 正規化 JSON) 相加後取 256 位元"""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+
+    def add(self, user_id, data):
+        canonical = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        digest = hashlib.sha256(user_id.encode("utf-8") + b"\0" + canonical.encode("utf-8")).digest()
+        self.total = (self.total + int.from_bytes(digest, "big")) & ((1 << 256) - 1)
+        self.count += 1
+
+    def hexdigest(self):
+        return f"{self.total:064x}"
+
+    def __eq__(self, other):
+        return self.count == other.count and self.total == other.total
+
+
+class Progress:
+    def __init__(self, label, every):
+        self.label = label
+        self.every = every
+        self.count = 0
+        self.start = time.perf_counter()
+
+    def tick(self):
+        self.count += 1
+        if self.every and self.count % self.every == 0:
+            self.report()
+
+    def finish(self):
+        # 補報最後不足一輪的筆數；every 為 0 時完全不回報
+        if self.every and self.count % self.every:
+            self.report()
+
+    def report(self):
+        elapsed = time.perf_counter() - self.start
+        print(f"[MemberMigrate] {self.label} {self.count} 筆，{elapsed:.1f} 秒，{self.count / max(elapsed, 1e-9):.0f} 筆/秒")
+
+
+def migrate(src, dst, workers=8, verify=True, progress_every=100000):
+    """串流搬移會員資料；verify 時回傳 (來源校驗碼, 目的校驗碼)"""
+    src_kind, src_path = parse_spec(src)
+    dst_kind, dst_path = parse_spec(dst)
+    if dst_kind not in WRITERS:
+        raise ValueError(f"{dst_kind} 只能當作來源")
+    writer = WRITERS[dst_kind](dst_path, workers)
+    source_sum = Checksum() if verify else None
+    progress = Progress("已搬移", progress_every)
+    try:
+        for user_id, data in READERS[src_kind](src_path):
+            writer.write(user_id, data)
+            if source_sum:
+                source_sum.add(user_id, data)
+            progress.tick()
+    except BaseException:
+        # 來源讀取失敗或被中斷時不取代既有的目的檔
+        writer.abort()
+        raise
+    writer.close()
+    progress.finish()
+    if not verify:
+        return None
+    dest_sum = Checksum()
+    progress = Progress("已驗證", progress_every)
+    for user_id, data in READERS[dst_kind](dst_path):
+        dest_sum.add(user_id, data)
+        progress.tick()
+    progress.finish()
+    return source_sum, dest_sum
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="會員資料格式轉換（json / dir / ndjson / sqlite / synthetic）")
+    parser.add_argument("src", help="來源，例如 json:members.json 或 synthetic:1000000")
+    parser.add_argument("dst", help="目的，例如 sqlite:members.db")
+    parser.add_argument("--workers", type=int, default=8, help="單一用戶檔的平行寫入執行緒數")
+    parser.add_argument("--progress", type=int, default=100000, help="每幾筆回報一次進度，0 為不回報")
+    parser.add_argument("--no-verify", action="store_true", help="略過搬移後的校驗")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    try:
+        result = migrate(args.src, args.dst, args.workers, not args.no_verify, args.progress)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"[ERROR] 搬移失敗：{e}")
+        return 1
+    elapsed = time.perf_counter() - start
+    if result is None:
+        print(f"[INFO] 搬移完成，未校驗，共 {elapsed:.1f} 秒")
+        return 0
+    source_sum, dest_sum = result
+    if source_sum != dest_sum:
+        print(f"[ERROR] 校驗失敗：來源 {source_sum.count} 筆 {source_sum.hexdigest()}，"
+              f"目的 {dest_sum.count} 筆 {dest_sum.hexdigest()}")
+        return 1
+    print(f"[INFO] 搬移完成 {source_sum.count} 筆，校驗碼 {source_sum.hexdigest()[:16]}，共 {elapsed:.1f} 秒")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,17 +3,17 @@ import os
 
 MEMBER_DIR = "backend/members/users"
 
-def load_member(user_id):
-    filepath = os.path.join(MEMBER_DIR, f"{user_id}.json")
+def load_member(user_id, member_dir=MEMBER_DIR):
+    filepath = os.path.join(member_dir, f"{user_id}.json")
     if os.path.exists(filepath):
         with open(filepath, "r", encoding="utf-8") as f:
             return json.load(f)
     else:
         return None
 
-def save_member(user_id, data):
-    os.makedirs(MEMBER_DIR, exist_ok=True)
-    filepath = os.path.join(MEMBER_DIR, f"{user_id}.json")
+def save_member(user_id, data, member_dir=MEMBER_DIR):
+    os.makedirs(member_dir, exist_ok=True)
+    filepath = os.path.join(member_dir, f"{user_id}.json")
     with open(filepath, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
 
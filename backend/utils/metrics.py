@@ -0,0 +1,75 @@
+import time
+import threading
+
+
+class Metrics:
+    """行程內的簡易計數器與耗時統計，供 /admin/metrics 查詢"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.counters = {}  # name -> 次數
+        self.timings = {}  # name -> {"count", "total", "max", "last"}
+        self.gauges = {}  # name -> 目前值（例如處理中的 webhook 數）
+
+    def incr(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, seconds):
+        with self.lock:
+            t = self.timings.get(name)
+            if t is None:
+                t = self.timings[name] = {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0}
+            t["count"] += 1
+            t["total"] += seconds
+            t["last"] = seconds
+            if seconds > t["max"]:
+                t["max"] = seconds
+
+    def adjust(self, name, delta):
+        with self.lock:
+            value = self.gauges[name] = self.gauges.get(name, 0) + delta
+        return value
+
+    def get(self, name):
+        return self.counters.get(name, 0)
+
+    def gauge(self, name):
+        return self.gauges.get(name, 0)
+
+    @staticmethod
+    def _ratio(counters, numerator, denominator):
+        d = counters.get(denominator, 0)
+        return round(counters.get(numerator, 0) / d, 3) if d else None
+
+    def snapshot(self):
+        with self.lock:
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            timings = {
+                name: {
+                    "count": t["count"],
+                    "avg_ms": round(t["total"] / t["count"] * 1000, 2) if t["count"] else 0.0,
+                    "max_ms": round(t["max"] * 1000, 2),
+                    "last_ms": round(t["last"] * 1000, 2),
+                }
+                for name, t in self.timings.items()
+            }
+        navigation = counters.get("events.navigation", 0)
+        business = counters.get("events.business", 0)
+        return {
+            "uptime": round(time.time() - self.started),
+            "counters": counters,
+            "timings": timings,
+            "gauges": gauges,
+            # 導覽事件 / 業務事件，比較 rich menu 上線前後的變化
+            "navigation_ratio": round(navigation / business, 3) if business else None,
+            "navigation_ratio_by_richmenu": {
+                segment: self._ratio(counters, f"events.{segment}.navigation", f"events.{segment}.business")
+                for segment in ("richmenu_off", "richmenu_on")
+            },
+        }
+
+
+metrics = Metrics()
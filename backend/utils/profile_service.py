@@ -0,0 +1,98 @@
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ProfileService:
+    """LINE 個人資料查詢：LRU + TTL 快取、失敗也快取一段時間，查詢在背景執行緒池進行
+
+    查到的資料先累積，達 batch_size 筆或超過 flush_interval 秒才交給 on_batch 一次寫回會員資料。
+    """
+
+    def __init__(self, fetch_func, on_batch, max_size=10000, ttl=24 * 60 * 60, negative_ttl=10 * 60,
+                 max_workers=4, max_pending=100, batch_size=20, flush_interval=5):
+        self.fetch_func = fetch_func  # user_id -> SDK Profile
+        self.on_batch = on_batch  # [(user_id, {"name", "picture_url"})] -> None
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.cache = OrderedDict()  # user_id -> (到期時間, 資料 或 None 表示查詢失敗)
+        self.pending = set()
+        self.backfill = []
+        self.last_flush = time.time()
+        self.timer = None  # 批次未滿時，最晚 flush_interval 秒後寫回
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def get_cached(self, user_id):
+        """回傳快取中的資料；未快取、已過期或上次查詢失敗都回傳 None"""
+        with self.lock:
+            entry = self.cache.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self.cache[user_id]
+                return None
+            self.cache.move_to_end(user_id)
+            return entry[1]
+
+    def _is_cached(self, user_id):
+        entry = self.cache.get(user_id)
+        return entry is not None and entry[0] >= time.time()
+
+    def _put(self, user_id, profile, ttl):
+        self.cache[user_id] = (time.time() + ttl, profile)
+        self.cache.move_to_end(user_id)
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+    def enrich(self, user_id):
+        """排入背景查詢；已快取（含失敗）、查詢中或佇列已滿時直接略過，不會阻塞呼叫端"""
+        with self.lock:
+            if self._is_cached(user_id) or user_id in self.pending or len(self.pending) >= self.max_pending:
+                return False
+            self.pending.add(user_id)
+        self.executor.submit(self._fetch, user_id)
+        return True
+
+    def _fetch(self, user_id):
+        try:
+            profile = self.fetch_func(user_id)
+            data = {"name": profile.display_name, "picture_url": profile.picture_url or ""}
+        except Exception as e:
+            print(f"[ProfileService] 取得用戶資料失敗 user_id={user_id}: {e}")
+            with self.lock:
+                self._put(user_id, None, self.negative_ttl)
+                self.pending.discard(user_id)
+            return
+        with self.lock:
+            self._put(user_id, data, self.ttl)
+            self.pending.discard(user_id)
+            self.backfill.append((user_id, data))
+            due = len(self.backfill) >= self.batch_size or time.time() - self.last_flush >= self.flush_interval
+            if not due and self.timer is None:
+                self.timer = threading.Timer(self.flush_interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+        if due:
+            self.flush()
+
+    def flush(self):
+        """把累積的資料一次交給 on_batch 寫回"""
+        with self.lock:
+            batch, self.backfill = self.backfill, []
+            self.last_flush = time.time()
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        if not batch:
+            return 0
+        try:
+            self.on_batch(batch)
+        except Exception as e:
+            print(f"[ProfileService] 回寫用戶資料失敗：{e}")
+        return len(batch)
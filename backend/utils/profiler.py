@@ -0,0 +1,136 @@
+import os
+import sys
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+class SamplingProfiler:
+    """定時取樣所有執行緒的呼叫堆疊，輸出 collapsed stack 格式（可用 flamegraph.pl / speedscope 開啟）
+
+    關閉時沒有任何取樣執行緒，對請求處理沒有額外成本。
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.counts = {}  # "a;b;c" -> 取樣次數
+        self.samples = 0
+        self.started = None
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self.thread is not None
+
+    def start(self, interval=None):
+        with self.lock:
+            if self.thread is not None:
+                return False
+            if interval:
+                self.interval = interval
+            self.counts = {}
+            self.samples = 0
+            self.started = time.time()
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self.thread.start()
+        print(f"[SamplingProfiler] 開始取樣，間隔 {self.interval * 1000:.1f} ms")
+        return True
+
+    def stop(self):
+        with self.lock:
+            thread, self.thread = self.thread, None
+        if thread is None:
+            return False
+        self.stop_event.set()
+        thread.join()
+        print(f"[SamplingProfiler] 停止取樣，共 {self.samples} 次")
+        return True
+
+    def toggle(self):
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                key = ";".join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+            self.samples += 1
+
+    def collapsed(self):
+        counts = dict(self.counts)
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
+
+
+class EventTrace:
+    __slots__ = ("route", "state", "user_id", "start", "stages")
+
+    def __init__(self, route, state, user_id):
+        self.route = route
+        self.state = state
+        self.user_id = user_id
+        self.start = time.perf_counter()
+        self.stages = []  # [(階段名稱, 秒數)]
+
+
+@contextmanager
+def stage(name):
+    """量測事件處理中的某個階段；不在事件處理中時只多一次屬性查詢"""
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.stages.append((name, time.perf_counter() - start))
+
+
+class SlowEventRecorder:
+    """超過門檻的 webhook 事件連同路由、狀態與各階段耗時保留在固定長度的環狀緩衝區"""
+
+    def __init__(self, threshold_ms=1000, capacity=100):
+        self.threshold = threshold_ms / 1000
+        self.events = deque(maxlen=capacity)
+
+    @contextmanager
+    def trace(self, route, state, user_id):
+        trace = _local.trace = EventTrace(route, state, user_id)
+        try:
+            yield trace
+        finally:
+            _local.trace = None
+            total = time.perf_counter() - trace.start
+            if total >= self.threshold:
+                self.events.append({
+                    "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                    "route": trace.route,
+                    "state": trace.state,
+                    "user_id": trace.user_id,
+                    "total_ms": round(total * 1000, 1),
+                    "stages": [{"name": n, "ms": round(t * 1000, 1)} for n, t in trace.stages],
+                })
+
+    def snapshot(self):
+        return list(self.events)
+
+
+profiler = SamplingProfiler()
+slow_events = SlowEventRecorder(threshold_ms=int(os.getenv("SLOW_EVENT_MS", "1000")))
@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import threading
+
+ANALYTICS_PATH = os.path.join(os.path.dirname(__file__), "..", "members", "quiz_analytics.json")
+
+
+class QuizAnalytics:
+    """每次作答即時累加的測驗統計，查詢時不需掃描全部會員"""
+
+    def __init__(self, snapshot_path=ANALYTICS_PATH, top_n=10, snapshot_every=50):
+        self.snapshot_path = snapshot_path
+        self.top_n = top_n
+        self.snapshot_every = snapshot_every  # 每累積多少次更新寫一次快照
+        self.lock = threading.Lock()
+        self.questions = {}  # level -> {question: [correct, total]}
+        self.levels = {}  # level -> [passes, attempts]
+        self.users = {}  # user_id -> [correct, total, streak, best_streak]
+        self.top = []  # [(correct, user_id), ...] 依答對數遞減，長度最多 top_n
+        self.dirty = 0
+        self.load()
+
+    def record_answer(self, user_id, level, question, correct):
+        with self.lock:
+            q = self.questions.setdefault(level, {}).setdefault(question, [0, 0])
+            q[1] += 1
+            u = self.users.setdefault(user_id, [0, 0, 0, 0])
+            u[1] += 1
+            if correct:
+                q[0] += 1
+                u[0] += 1
+                u[2] += 1
+                if u[2] > u[3]:
+                    u[3] = u[2]
+                self._update_top(user_id, u[0])
+            else:
+                u[2] = 0
+            self.dirty += 1
+        self.maybe_snapshot()
+
+    def record_result(self, user_id, level, passed):
+        with self.lock:
+            stat = self.levels.setdefault(level, [0, 0])
+            stat[1] += 1
+            if passed:
+                stat[0] += 1
+            self.dirty += 1
+        self.maybe_snapshot()
+
+    def _update_top(self, user_id, correct):
+        # 排行榜長度固定為 top_n，每次更新成本與會員數無關
+        top = self.top
+        for i, (_, uid) in enumerate(top):
+            if uid == user_id:
+                del top[i]
+                break
+        else:
+            if len(top) >= self.top_n and correct <= top[-1][0]:
+                return
+        i = len(top)
+        while i > 0 and top[i - 1][0] < correct:
+            i -= 1
+        top.insert(i, (correct, user_id))
+        del top[self.top_n:]
+
+    def query(self, level=None, limit=None):
+        """各題答對率（由低到高，最常答錯的在前）、各級通過率、個人連對紀錄與排行榜"""
+        with self.lock:
+            levels = [level] if level else list(self.questions)
+            questions = []
+            for lv in levels:
+                for question, (correct, total) in self.questions.get(lv, {}).items():
+                    questions.append({
+                        "level": lv,
+                        "question": question,
+                        "correct": correct,
+                        "total": total,
+                        "accuracy": round(correct / total, 3) if total else None,
+                    })
+            questions.sort(key=lambda q: (q["accuracy"] if q["accuracy"] is not None else 1, -q["total"]))
+            if limit:
+                questions = questions[:limit]
+            level_stats = {
+                lv: {"passes": passes, "attempts": attempts, "pass_rate": round(passes / attempts, 3) if attempts else None}
+                for lv, (passes, attempts) in self.levels.items()
+                if not level or lv == level
+            }
+            leaderboard = [
+                {"user_id": uid, "correct": correct, "best_streak": self.users[uid][3]}
+                for correct, uid in self.top
+            ]
+        return {"questions": questions, "levels": level_stats, "leaderboard": leaderboard}
+
+    def user_stats(self, user_id):
+        with self.lock:
+            u = self.users.get(user_id)
+        if not u:
+            return None
+        return {"correct": u[0], "total": u[1], "streak": u[2], "best_streak": u[3]}
+
+    def maybe_snapshot(self):
+        if self.dirty >= self.snapshot_every:
+            self.snapshot()
+
+    def snapshot(self):
+        """寫出精簡快照（無縮排），先寫暫存檔再改名避免寫到一半"""
+        with self.lock:
+            if not self.dirty:
+                return
+            data = json.dumps({
+                "saved": time.time(),
+                "questions": self.questions,
+                "levels": self.levels,
+                "users": self.users,
+                "top": self.top,
+            }, ensure_ascii=False, separators=(",", ":"))
+            # 寫檔也在 lock 內：請求端與排程器可能同時快照，不能同時寫同一個暫存檔
+            try:
+                tmp_path = self.snapshot_path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    f.write(data)
+                os.replace(tmp_path, self.snapshot_path)
+            except Exception as e:
+                # 保留異動數，下一次快照會重試
+                print(f"[QuizAnalytics] 儲存統計快照失敗：{e}")
+                return
+            self.dirty = 0
+
+    def load(self):
+        if not os.path.isfile(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.questions = data.get("questions", {})
+            self.levels = data.get("levels", {})
+            self.users = data.get("users", {})
+            self.top = [tuple(t) for t in data.get("top", [])]
+            print(f"[QuizAnalytics] 載入測驗統計：{len(self.users)} 位用戶")
+        except Exception as e:
+            print(f"[QuizAnalytics] 載入統計快照失敗：{e}")
@@ -0,0 +1,212 @@
+import time
+import random
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+from backend.utils.metrics import metrics
+
+
+class IntervalTrigger:
+    """每隔固定秒數執行一次"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def next_after(self, t):
+        return t + self.seconds
+
+
+class CronTrigger:
+    """五欄 cron 表示式（分 時 日 月 週，以本地時間計）；支援 *、a-b、a,b、*/n、a-b/n 與 a/n（a 到上限每 n）
+
+    日與週兩欄都有限制時，符合其一即可，與一般 cron 相同。
+    """
+
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expr):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron 表示式需要 5 個欄位：{expr}")
+        self.expr = expr
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse(field, low, high) for field, (low, high) in zip(fields, self.RANGES)
+        )
+        self.weekdays = {v % 7 for v in weekdays}  # 週日可寫成 0 或 7
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for part in field.split(","):
+            part, _, step = part.partition("/")
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start, end = (int(v) for v in part.split("-", 1))
+            elif step:
+                start, end = int(part), high  # 與一般 cron 相同，「5/15」代表 5-59/15
+            else:
+                start = end = int(part)
+            if not low <= start <= end <= high:
+                raise ValueError(f"cron 欄位超出範圍：{field}")
+            values.update(range(start, end + 1, int(step or 1)))
+        return values
+
+    def _day_matches(self, dt):
+        weekday = (dt.weekday() + 1) % 7  # cron 以週日為 0
+        if self.any_day or self.any_weekday:
+            return dt.day in self.days and weekday in self.weekdays
+        return dt.day in self.days or weekday in self.weekdays
+
+    def next_after(self, t):
+        dt = datetime.fromtimestamp(t).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+            elif dt.hour not in self.hours:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+            elif dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+            else:
+                return dt.timestamp()
+        raise ValueError(f"cron 表示式永遠不會觸發：{self.expr}")
+
+
+class Job:
+    def __init__(self, name, func, trigger, jitter=0, low_priority=False, max_defer=None):
+        self.name = name
+        self.func = func
+        self.trigger = trigger
+        self.jitter = jitter
+        self.low_priority = low_priority
+        self.max_defer = max_defer  # 低優先工作最多延後幾秒，超過就照常執行，避免一直餓死
+        self.scheduled = None  # 觸發器排定的時間（不含抖動），用來計算錯過的次數
+        self.next_run = None
+        self.running = False
+        self.deferred_since = None
+
+    def schedule(self, scheduled):
+        self.scheduled = scheduled
+        self.next_run = scheduled + (random.uniform(0, self.jitter) if self.jitter else 0)
+
+
+class Scheduler:
+    """行程內的背景工作排程器：單一排程執行緒決定時間，工作交給獨立的執行緒池
+
+    - 同一工作上一次還沒跑完時跳過該次，記為 missed
+    - 排程時間已過好幾個週期（例如長時間延後或機器休眠）只補跑一次，其餘記為 missed
+    - 低優先工作在 load_func() 回報的 webhook 處理中數量達到 busy_threshold 時延後
+    耗時與次數寫入 metrics：scheduler.<name>（耗時）、scheduler.<name>.runs/missed/deferred/errors
+    """
+
+    def __init__(self, max_workers=2, load_func=None, busy_threshold=4, defer_delay=5):
+        self.jobs = {}
+        self.load_func = load_func
+        self.busy_threshold = busy_threshold
+        self.defer_delay = defer_delay
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scheduler-job")
+        self.cond = threading.Condition()
+        self.thread = None
+        self.stopped = False
+
+    def add_job(self, name, func, trigger, jitter=0, low_priority=False, max_defer=None, run_now=False):
+        job = Job(name, func, trigger, jitter, low_priority, max_defer)
+        now = time.time()
+        if run_now:
+            job.scheduled = job.next_run = now
+        else:
+            job.schedule(trigger.next_after(now))
+        with self.cond:
+            self.jobs[name] = job
+            self.cond.notify()
+        return job
+
+    def start(self):
+        with self.cond:
+            if self.thread is not None:
+                return
+            self.stopped = False
+            self.thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+            self.thread.start()
+        print(f"[Scheduler] 啟動，共 {len(self.jobs)} 個工作")
+
+    def stop(self, wait=True):
+        with self.cond:
+            self.stopped = True
+            thread, self.thread = self.thread, None
+            self.cond.notify()
+        if thread is not None:
+            thread.join()
+        self.executor.shutdown(wait=wait)
+
+    def _loop(self):
+        while True:
+            with self.cond:
+                if self.stopped:
+                    return
+                now = time.time()
+                due = [job for job in self.jobs.values() if job.next_run <= now]
+                if not due:
+                    next_run = min((job.next_run for job in self.jobs.values()), default=None)
+                    self.cond.wait(None if next_run is None else next_run - now)
+                    continue
+            for job in due:
+                self._dispatch(job, now)
+
+    def _dispatch(self, job, now):
+        prefix = f"scheduler.{job.name}"
+        if job.low_priority and self.load_func and self.load_func() >= self.busy_threshold:
+            if job.deferred_since is None:
+                job.deferred_since = now
+            if job.max_defer is None or now - job.deferred_since < job.max_defer:
+                metrics.incr(prefix + ".deferred")
+                job.next_run = now + self.defer_delay
+                return
+        job.deferred_since = None
+
+        # 依原定時間往後推，跳過已經錯過的週期
+        scheduled = job.trigger.next_after(job.scheduled)
+        missed = 0
+        while scheduled <= now:
+            missed += 1
+            scheduled = job.trigger.next_after(scheduled)
+        job.schedule(scheduled)
+
+        overlapping = job.running  # 上一次還沒跑完，這次跳過
+        if missed or overlapping:
+            metrics.incr(prefix + ".missed", missed + overlapping)
+        if overlapping:
+            return
+        job.running = True
+        self.executor.submit(self._run, job)
+
+    def _run(self, job):
+        prefix = f"scheduler.{job.name}"
+        start = time.perf_counter()
+        try:
+            job.func()
+        except Exception as e:
+            metrics.incr(prefix + ".errors")
+            print(f"[Scheduler] 工作 {job.name} 執行失敗：{e}")
+        finally:
+            metrics.observe(prefix, time.perf_counter() - start)
+            metrics.incr(prefix + ".runs")
+            job.running = False
+
+    def snapshot(self):
+        """各工作的下次執行時間與狀態"""
+        with self.cond:
+            return {
+                name: {
+                    "next_run": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(job.next_run)),
+                    "running": job.running,
+                    "low_priority": job.low_priority,
+                }
+                for name, job in self.jobs.items()
+            }
@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import zlib
+import struct
+import threading
+
+STATE_LOG_DIR = os.path.join(os.path.dirname(__file__), "..", "members", "state_log")
+LOG_FILENAME = "state.log"
+SNAPSHOT_FILENAME = "state.snapshot"
+HEADER = struct.Struct(">II")  # 資料長度、crc32
+
+
+class StateLog:
+    """對話狀態的 append-only 事件紀錄
+
+    每筆紀錄是「某位用戶處理完一則事件後的完整狀態」，以長度前綴 + crc32 的二進位格式追加。
+    累積 snapshot_every 筆後寫出壓縮快照並清空紀錄，重啟時只需載入快照再重播尾端，
+    回復時間與機器人執行多久無關。同一用戶的紀錄彼此覆蓋，重播多次結果相同。
+    """
+
+    def __init__(self, log_dir=STATE_LOG_DIR, snapshot_every=1000):
+        self.log_dir = log_dir
+        self.snapshot_every = snapshot_every
+        self.log_path = os.path.join(log_dir, LOG_FILENAME)
+        self.snapshot_path = os.path.join(log_dir, SNAPSHOT_FILENAME)
+        self.lock = threading.Lock()
+        self.encoded = {}  # user_id -> 已序列化的狀態，用來比對是否變更與寫快照
+        self.pending = 0  # 快照後追加的紀錄數
+        self.file = None
+
+    def recover(self):
+        """載入最新快照並重播尾端紀錄，回傳 {user_id: 狀態}"""
+        start = time.perf_counter()
+        os.makedirs(self.log_dir, exist_ok=True)
+        states = {}
+        if os.path.isfile(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                    states = json.load(f)
+            except Exception as e:
+                print(f"[StateLog] 讀取快照失敗，只重播紀錄：{e}")
+
+        replayed, good_offset = self.replay(states)
+        # 截掉寫到一半或損毀的尾端，之後從乾淨的位置繼續追加
+        if os.path.isfile(self.log_path) and os.path.getsize(self.log_path) != good_offset:
+            with open(self.log_path, "r+b") as f:
+                f.truncate(good_offset)
+            print(f"[StateLog] 截斷損毀的紀錄尾端於 {good_offset} bytes")
+
+        self.encoded = {user_id: self.encode(state) for user_id, state in states.items()}
+        self.pending = replayed
+        self.file = open(self.log_path, "ab")
+        elapsed = time.perf_counter() - start
+        print(f"[StateLog] 回復 {len(states)} 位用戶狀態（重播 {replayed} 筆，{elapsed * 1000:.1f} ms）")
+        return states
+
+    @staticmethod
+    def encode(value):
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def replay(self, states):
+        """把紀錄套用到 states，回傳 (套用筆數, 最後一筆完整紀錄的結尾位置)"""
+        if not os.path.isfile(self.log_path):
+            return 0, 0
+        count = 0
+        offset = 0
+        with open(self.log_path, "rb") as f:
+            data = f.read()
+        end = len(data)
+        while offset + HEADER.size <= end:
+            length, crc = HEADER.unpack_from(data, offset)
+            body_start = offset + HEADER.size
+            body = data[body_start:body_start + length]
+            if len(body) < length or zlib.crc32(body) != crc:
+                break
+            user_id, state = json.loads(body)
+            if state:
+                states[user_id] = state
+            else:
+                states.pop(user_id, None)
+            offset = body_start + length
+            count += 1
+        return count, offset
+
+    def append(self, user_id, state):
+        """記錄用戶最新狀態；state 為空表示已回到初始狀態"""
+        # 傳入的狀態可能是線上仍會被修改的物件，立刻序列化成位元組保存
+        encoded = self.encode(state) if state else None
+        with self.lock:
+            if self.file is None:
+                return
+            if encoded:
+                if self.encoded.get(user_id) == encoded:
+                    return  # 狀態沒變就不寫
+                self.encoded[user_id] = encoded
+            elif user_id in self.encoded:
+                del self.encoded[user_id]
+            else:
+                return
+            body = b"[" + self.encode(user_id) + b"," + (encoded or b"null") + b"]"
+            self.file.write(HEADER.pack(len(body), zlib.crc32(body)) + body)
+            self.file.flush()
+            self.pending += 1
+            if self.pending >= self.snapshot_every:
+                self._compact()
+
+    def compact(self):
+        with self.lock:
+            if self.file is not None and self.pending:
+                self._compact()
+
+    def _compact(self):
+        # 先寫好快照再清空紀錄；若在兩步之間當機，重播舊紀錄結果仍相同
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"{" + b",".join(self.encode(uid) + b":" + data for uid, data in self.encoded.items()) + b"}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        self.file.close()
+        self.file = open(self.log_path, "wb")
+        self.pending = 0
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+if __name__ == "__main__":
+    # 重播吞吐量基準測試：python -m backend.utils.state_log [紀錄筆數]
+    import sys
+    import random
+    import tempfile
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    with tempfile.TemporaryDirectory() as tmp:
+        log = StateLog(tmp, snapshot_every=count + 1)
+        log.recover()
+        start = time.perf_counter()
+        for i in range(count):
+            user_id = f"U{random.randrange(count // 10):032x}"
+            log.append(user_id, {
+                "mode": "quiz_mode",
+                "quiz": {"level": "一般會員", "index": i % 10, "correct_count": i % 7},
+                "order": list(range(10)),
+            })
+        print(f"寫入 {count} 筆：{count / (time.perf_counter() - start):.0f} 筆/秒")
+        log.close()
+
+        log = StateLog(tmp, snapshot_every=count + 1)
+        start = time.perf_counter()
+        states = log.recover()
+        elapsed = time.perf_counter() - start
+        print(f"重播 {count} 筆：{elapsed * 1000:.0f} ms，{count / elapsed:.0f} 筆/秒，{len(states)} 位用戶")
+
+        log.compact()
+        log.close()
+        log = StateLog(tmp)
+        start = time.perf_counter()
+        log.recover()
+        print(f"壓縮後從快照回復：{(time.perf_counter() - start) * 1000:.0f} ms")
+        log.close()